@@ -84,7 +84,7 @@
 
     nativeBuildInputs = [makeWrapper souffle];
     propagatedBuildInputs = with python3.pkgs;
-      [jsonschema psutil json5 mcpp]
+      [jsonschema fastjsonschema psutil json5 mcpp]
       ++ lib.optionals enableRich [rich];
 
     passthru = {
@@ -277,6 +277,7 @@
               ps.black
               ps.isort
               ps.jsonschema
+              ps.fastjsonschema
               ps.psutil
               ps.pyjson5
               ps.sphinx
@@ -123,9 +123,15 @@ def status_isatty():
 
 
 class SouffleDialect(csv.Dialect):
+    """Souffle's fact file format with rfc4180=true: tab-separated, fields
+    containing tabs, quotes or newlines are quoted, and quotes are doubled"""
+
     delimiter = "\t"
     quotechar = '"'
     escapechar = None
+    doublequote = True
+    quoting = csv.QUOTE_MINIMAL
+    lineterminator = "\n"
 
 
 def modified_after(ref=None, test=None):
@@ -0,0 +1,326 @@
+"""
+Cache of compiled analyses
+
+A compiled analysis depends on more than its preprocessed Datalog: on the
+Souffle version, the C++ compiler and its flags, the functor library it links
+with, and whether it's compiled for parallel execution. Each binary is stored
+under a key hashed from all of them, next to a manifest entry recording the
+key's flags, the binary's size, how long it took to build and when it was last
+used.
+
+Concurrent runs (say, CI jobs) may share the cache. A key is compiled by one
+run at a time, under a lock, into a temporary file that's published by
+renaming it, so runs never see a partial binary nor compile the same one
+twice.
+
+    cache = AnalysisCache()
+    key = cache.key(src, flags)
+    bin = cache.get_or_build(key, flags, lambda out: compile(src, out))
+
+The model facts cache (see modelcache) and the preprocessed Datalog cache
+live in the same directory, so 'ctadl cache gc' evicts their entries too.
+"""
+
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from itertools import chain
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Union
+
+from ctadl import analysiscachedir
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the manifest entry format changes
+MANIFEST_VERSION = 1
+
+# Temporary build directories older than this are left over from killed runs
+stale_build_s = 24 * 60 * 60
+
+
+@dataclass
+class CacheEntry:
+    kind: str
+    key: str
+    path: Path
+    size: int
+    last_used: float
+    build_time: Optional[float] = None
+    flags: Optional[dict[str, Any]] = None
+
+
+def file_digest(filename: Union[str, Path]) -> str:
+    algo = hashlib.sha256()
+    with open(filename, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            algo.update(block)
+    return algo.hexdigest()
+
+
+def _write_json_atomically(path: Path, value: Any) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(value, fp, sort_keys=True)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+class AnalysisCache:
+    """Cache of compiled analyses with a manifest entry per binary"""
+
+    # Kinds of the entries of other caches in the same directory, and the
+    # patterns of their files
+    file_caches = [
+        ("model-facts", "model-facts/*.jsonl.gz"),
+        ("preprocessed", "preprocessed/*.dl"),
+    ]
+
+    def __init__(self, cachedir: Path = analysiscachedir):
+        self.cachedir = cachedir
+        self.manifestdir = cachedir / "manifest"
+
+    def key(self, src: Union[str, Path], flags: dict[str, Any]) -> str:
+        """Returns the key of the analysis compiled from src with flags"""
+        algo = hashlib.sha256()
+        algo.update(file_digest(src).encode())
+        algo.update(json.dumps(flags, sort_keys=True).encode())
+        return algo.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cachedir / key
+
+    def entry_path(self, key: str) -> Path:
+        return self.manifestdir / f"{key}.json"
+
+    def read_entry(self, key: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(self.entry_path(key), "r") as fp:
+                entry = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get("version") != MANIFEST_VERSION:
+            return None
+        return entry
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Returns the binary for key and records its use, or returns None if
+        key isn't cached"""
+        entry = self.read_entry(key)
+        bin = self.path(key)
+        if entry is None or not bin.exists():
+            return None
+        entry["last_used"] = time.time()
+        _write_json_atomically(self.entry_path(key), entry)
+        return bin
+
+    @contextlib.contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        os.makedirs(self.manifestdir, exist_ok=True)
+        with open(self.manifestdir / f"{key}.lock", "w") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def get_or_build(
+        self, key: str, flags: dict[str, Any], build: Callable[[Path], None]
+    ) -> Path:
+        """Returns the binary for key, calling build to compile it to the
+        given path if it isn't cached"""
+        bin = self.lookup(key)
+        if bin is not None:
+            return bin
+        with self._lock(key):
+            # Another run may have built it while we waited for the lock
+            bin = self.lookup(key)
+            if bin is not None:
+                logger.debug("analysis %s was built by another run", key)
+                return bin
+            builddir = tempfile.mkdtemp(dir=self.cachedir, prefix=f".{key}.")
+            try:
+                out = Path(builddir) / "analysis"
+                start_time = time.time()
+                build(out)
+                build_time = time.time() - start_time
+                os.replace(out, self.path(key))
+            finally:
+                shutil.rmtree(builddir, ignore_errors=True)
+            now = time.time()
+            _write_json_atomically(
+                self.entry_path(key),
+                dict(
+                    version=MANIFEST_VERSION,
+                    key=key,
+                    flags=flags,
+                    size=self.path(key).stat().st_size,
+                    build_time=build_time,
+                    built_at=now,
+                    last_used=now,
+                ),
+            )
+        return self.path(key)
+
+    def entries(self) -> list[CacheEntry]:
+        """Returns the compiled analyses and model facts in the cache"""
+        result = []
+        if self.manifestdir.is_dir():
+            for entry_path in self.manifestdir.glob("*.json"):
+                key = entry_path.stem
+                entry = self.read_entry(key)
+                bin = self.path(key)
+                if entry is None or not bin.exists():
+                    continue
+                result.append(
+                    CacheEntry(
+                        kind="analysis",
+                        key=key,
+                        path=bin,
+                        size=entry["size"],
+                        last_used=entry["last_used"],
+                        build_time=entry["build_time"],
+                        flags=entry["flags"],
+                    )
+                )
+        # Binaries from before the manifest, named by their Datalog's hash
+        managed = {e.key for e in result}
+        for path in self.cachedir.glob("?" * 64):
+            if path.is_file() and path.name not in managed:
+                # Other runs remove files while we list them
+                with contextlib.suppress(FileNotFoundError):
+                    st = path.stat()
+                    result.append(
+                        CacheEntry(
+                            "unmanaged", path.name, path, st.st_size, st.st_mtime
+                        )
+                    )
+        # These caches touch entries when they load them
+        for kind, pattern in self.file_caches:
+            for path in self.cachedir.glob(pattern):
+                with contextlib.suppress(FileNotFoundError):
+                    st = path.stat()
+                    key = path.name.split(".", 1)[0]
+                    result.append(CacheEntry(kind, key, path, st.st_size, st.st_mtime))
+        return result
+
+    def remove(self, entry: CacheEntry) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            if entry.kind == "analysis":
+                # Removes the manifest entry first, so lookups miss. The lock
+                # file stays: runs may hold or wait on it, and one that opened
+                # a new lock file would compile the key alongside them
+                os.unlink(self.entry_path(entry.key))
+            os.unlink(entry.path)
+
+    def gc(self, max_bytes: int) -> list[CacheEntry]:
+        """Removes the least recently used entries until the cache takes at
+        most max_bytes, and temporaries left over from killed runs. Returns
+        the removed entries"""
+        now = time.time()
+        for tmp in chain(self.cachedir.glob(".*.*"), self.cachedir.glob("*/*.tmp")):
+            # Other runs rename their temporaries into place while we list them
+            with contextlib.suppress(FileNotFoundError):
+                if now - tmp.stat().st_mtime > stale_build_s:
+                    logger.debug("removing stale temporary %s", tmp)
+                    if tmp.is_dir():
+                        shutil.rmtree(tmp, ignore_errors=True)
+                    else:
+                        tmp.unlink(missing_ok=True)
+        entries = sorted(self.entries(), key=lambda e: e.last_used)
+        total = sum(e.size for e in entries)
+        removed = []
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            logger.debug("evicting %s %s", entry.kind, entry.key)
+            self.remove(entry)
+            total -= entry.size
+            removed.append(entry)
+        return removed
+
+
+@functools.cache
+def tree_digest(root: Path) -> str:
+    """Returns a digest of the files under root and their relative paths"""
+    algo = hashlib.sha256()
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and "__pycache__" not in path.parts:
+            algo.update(str(path.relative_to(root)).encode())
+            algo.update(file_digest(path).encode())
+    return algo.hexdigest()
+
+
+class PreprocessedCache:
+    """Cache of preprocessed Datalog
+
+    Preprocessing depends on the Datalog tree the source includes from, the
+    preprocessor's command line (which holds the macros) and the Datalog
+    appended to its output. Each output is kept under a key hashed from them,
+    so runs that would preprocess the same thing copy it instead of running
+    the preprocessor."""
+
+    def __init__(self, cachedir: Path = analysiscachedir / "preprocessed"):
+        self.cachedir = cachedir
+
+    def key(
+        self,
+        tree: Path,
+        command: list[str],
+        appended: Optional[Union[str, Path]] = None,
+    ) -> str:
+        algo = hashlib.sha256()
+        algo.update(tree_digest(tree).encode())
+        algo.update(json.dumps(command).encode())
+        if appended is not None:
+            algo.update(file_digest(appended).encode())
+        return algo.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cachedir / f"{key}.dl"
+
+    def load(self, key: str, filename: Union[str, Path]) -> bool:
+        """Copies the preprocessed Datalog for key to filename, returning
+        whether key is cached"""
+        try:
+            shutil.copyfile(self.path(key), filename)
+        except FileNotFoundError:
+            return False
+        # Marks the entry used, for 'ctadl cache gc', which may have removed
+        # it since
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self.path(key))
+        return True
+
+    def store(self, key: str, filename: Union[str, Path]) -> None:
+        os.makedirs(self.cachedir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(filename, tmp)
+            os.replace(tmp, self.path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+def other_version_dirs(cachedir: Path = analysiscachedir) -> list[Path]:
+    """Returns the caches of other CTADL versions, which this one never uses"""
+    if not cachedir.parent.is_dir():
+        return []
+    return sorted(d for d in cachedir.parent.iterdir() if d.is_dir() and d != cachedir)
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
@@ -0,0 +1,150 @@
+"""
+Scheduling the indexing of many SUTs under a CPU and memory budget
+
+A batch manifest lists the SUTs to index, as JSON:
+
+    {
+      "suts": [
+        {"import": "apks/app1"},
+        {"import": "fw/router", "output": "indexes/router.db",
+         "flags": ["--star", "--max-memory", "48"], "jobs": 16}
+      ]
+    }
+
+Relative paths are relative to the manifest. Each SUT is indexed in its
+import directory, or in the directory of its import file, and no two SUTs may
+share one. Each SUT is indexed with as many jobs as its "jobs", or as its
+workload warrants: one for SUTs under twice the engine threshold, doubling
+with every doubling of the workload. It reserves the memory given by its
+--max-memory, or else its share of the budget in proportion to its jobs. The
+largest SUTs are started first, and smaller ones are packed around them into
+the CPUs and memory left over:
+
+    schedule = Schedule(items, cpus=32, memory_gib=256)
+    while (item := schedule.next()) is not None:
+        ...  # start item
+    schedule.finish(item)  # when it's done
+"""
+
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from ctadl.engine import default_threshold_bytes
+
+
+@dataclass
+class BatchItem:
+    name: str
+    importdir: Path
+    output: Optional[Path] = None
+    flags: list[str] = field(default_factory=list)
+    jobs: Optional[int] = None
+    workload: float = 0.0
+    memory_gib: float = 0.0
+
+    @property
+    def directory(self) -> Path:
+        """The directory its ctadl runs in, which gets its index, logs and
+        intermediate files"""
+        return self.importdir if self.importdir.is_dir() else self.importdir.parent
+
+
+def read_manifest(path: Path) -> list[BatchItem]:
+    """Reads the SUTs in a manifest. Raises ValueError if it's malformed"""
+    with open(path, "r") as fp:
+        try:
+            doc = json.load(fp)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e}") from e
+    suts = doc.get("suts") if isinstance(doc, dict) else None
+    if not isinstance(suts, list):
+        raise ValueError("expected an object with a 'suts' list")
+    base = path.parent
+    items = []
+    names = set()
+    directories: dict[Path, str] = dict()
+    for i, sut in enumerate(suts):
+        if not isinstance(sut, dict) or not isinstance(sut.get("import"), str):
+            raise ValueError(f"suts[{i}]: expected an object with an 'import' path")
+        flags = sut.get("flags", [])
+        if not isinstance(flags, list) or not all(isinstance(f, str) for f in flags):
+            raise ValueError(f"suts[{i}].flags: expected a list of strings")
+        jobs = sut.get("jobs")
+        if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+            raise ValueError(f"suts[{i}].jobs: expected a positive integer")
+        importdir = base / sut["import"]
+        name = sut.get("name", importdir.name)
+        if name in names:
+            raise ValueError(f"suts[{i}]: duplicate name '{name}'")
+        names.add(name)
+        output = sut.get("output")
+        item = BatchItem(
+            name=name,
+            importdir=importdir,
+            output=base / output if output is not None else None,
+            flags=flags,
+            jobs=jobs,
+        )
+        # SUTs that run in the same directory overwrite each other's index
+        # and logs. Imports that don't exist are reported when they're read
+        if importdir.exists():
+            directory = item.directory.resolve()
+            if directory in directories:
+                raise ValueError(
+                    f"suts[{i}]: '{name}' runs in the same directory as"
+                    f" '{directories[directory]}': '{directory}'"
+                )
+            directories[directory] = name
+        items.append(item)
+    return items
+
+
+def workload_jobs(workload: float, cpus: int) -> int:
+    """Returns the jobs to index a workload with"""
+    if workload < 2 * default_threshold_bytes:
+        return 1
+    return min(cpus, 2 ** int(math.log2(workload / default_threshold_bytes)))
+
+
+class Schedule:
+    """Decides which SUT to start next. Items need their jobs and memory_gib
+    set"""
+
+    def __init__(self, items: list[BatchItem], cpus: int, memory_gib: float):
+        self.pending = sorted(items, key=lambda item: item.workload, reverse=True)
+        self.running: list[BatchItem] = []
+        self.free_cpus = cpus
+        self.free_memory_gib = memory_gib
+
+    def next(self) -> Optional[BatchItem]:
+        """Returns the largest pending item that fits in what's free, and
+        marks it running. An item that doesn't fit in the whole budget runs
+        alone"""
+        for i, item in enumerate(self.pending):
+            assert item.jobs is not None
+            if item.jobs <= self.free_cpus and item.memory_gib <= self.free_memory_gib:
+                break
+        else:
+            if self.running or not self.pending:
+                return None
+            i = 0
+        item = self.pending.pop(i)
+        assert item.jobs is not None
+        self.running.append(item)
+        self.free_cpus -= item.jobs
+        self.free_memory_gib -= item.memory_gib
+        return item
+
+    def finish(self, item: BatchItem) -> None:
+        assert item.jobs is not None
+        self.running.remove(item)
+        self.free_cpus += item.jobs
+        self.free_memory_gib += item.memory_gib
+
+
+def write_report(path: Path, report: dict) -> None:
+    with open(path, "w") as fp:
+        json.dump(report, fp, indent=1)
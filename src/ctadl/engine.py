@@ -0,0 +1,113 @@
+"""
+Choosing between Souffle's interpreter and a compiled analysis
+
+Compiling an analysis costs minutes up front but runs several times faster
+than interpreting it, so interpreting wins for small workloads when the
+analysis isn't compiled yet. The workload is estimated from the size of the
+facts (or the index) in bytes, weighted by the features that make the
+analysis more expensive:
+
+    workload = estimate_workload(nbytes, star=True, cha=False)
+    runs = EngineRuns()
+    if workload < runs.threshold("index", compile_seconds):
+        ...  # interpret
+
+Each run is recorded in EngineRuns, and once there are both interpreted and
+compiled runs of a phase, the threshold is where their fitted costs break
+even instead of the default.
+"""
+
+import json
+import logging
+import math
+import os
+import statistics
+from pathlib import Path
+from typing import Literal
+
+from ctadl import analysiscachedir
+
+logger = logging.getLogger(__name__)
+
+Engine = Literal["compiled", "interpreted"]
+
+# Weighted workload, in bytes, under which interpreting beats compiling when
+# there are no recorded runs to go by
+default_threshold_bytes = 16 * 2**20
+
+# Runs of each phase and engine to fit the threshold from
+recent_runs = 50
+
+
+def estimate_workload(
+    nbytes: int, star: bool = False, cha: bool = False, hybrid_inlining: bool = False
+) -> float:
+    """Returns nbytes weighted by the features that slow down the analysis"""
+    weight = 1.0
+    if star:
+        weight *= 4.0
+    if cha:
+        weight *= 2.0
+    if hybrid_inlining:
+        weight *= 2.0
+    return nbytes * weight
+
+
+class EngineRuns:
+    """Log of analysis runs, as JSON Lines, to fit the threshold from"""
+
+    def __init__(self, path: Path = analysiscachedir / "engine-runs.jsonl"):
+        self.path = path
+
+    def record(
+        self, phase: str, engine: Engine, workload: float, seconds: float
+    ) -> None:
+        os.makedirs(self.path.parent, exist_ok=True)
+        line = json.dumps(
+            dict(phase=phase, engine=engine, workload=workload, seconds=seconds)
+        )
+        # Appends of one short line are atomic, so concurrent runs don't
+        # interleave
+        with open(self.path, "a") as fp:
+            fp.write(line + "\n")
+
+    def runs(self, phase: str, engine: Engine) -> list[dict]:
+        try:
+            with open(self.path, "r") as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            return []
+        result = []
+        for line in lines:
+            try:
+                run = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if run.get("phase") == phase and run.get("engine") == engine:
+                result.append(run)
+        return result[-recent_runs:]
+
+    def threshold(self, phase: str, compile_seconds: list[float]) -> float:
+        """Returns the workload under which interpreting phase is faster than
+        compiling it and running the result
+
+        Interpreting a workload w takes about w * ri seconds, and compiling
+        then running it takes about c + w * rc, where ri and rc are the median
+        seconds per unit of workload of recorded runs and c is the median of
+        compile_seconds. Returns the default unless all three are known."""
+        rates = []
+        for engine in ["interpreted", "compiled"]:
+            runs = [r for r in self.runs(phase, engine) if r["workload"] > 0]
+            if not runs:
+                return default_threshold_bytes
+            rates.append(statistics.median(r["seconds"] / r["workload"] for r in runs))
+        if not compile_seconds:
+            return default_threshold_bytes
+        interpreted_rate, compiled_rate = rates
+        if interpreted_rate <= compiled_rate:
+            return math.inf
+        return statistics.median(compile_seconds) / (interpreted_rate - compiled_rate)
+
+
+def choose_engine(workload: float, threshold: float) -> Engine:
+    return "interpreted" if workload < threshold else "compiled"
@@ -0,0 +1,102 @@
+"""
+Limiting the memory of a subprocess
+
+A MemoryLimit is enforced in up to three ways, so a run that outgrows it fails
+promptly instead of being OOM-killed hours later, or taking the machine down
+with it:
+
+- If systemd-run can put the process in a transient cgroup scope, the scope's
+  MemoryMax is the limit, and the kernel kills the process when it's reached.
+- Otherwise, the process's data size rlimit is the limit, so its allocations
+  fail once it's reached.
+- The caller watches the process's RSS while it runs (see Command._spawn) and
+  kills it when it's over.
+
+    limit = MemoryLimit(16 * 2**30)
+    process = subprocess.Popen(limit.command(cmd), preexec_fn=limit.preexec)
+    ...
+    if limit.exceeded(rss):
+        process.kill()
+"""
+
+import functools
+import logging
+import resource
+import shutil
+import signal
+import subprocess
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def systemd_run_scope_available() -> bool:
+    """Returns whether systemd-run can start a memory-limited user scope"""
+    systemd_run = shutil.which("systemd-run")
+    if systemd_run is None:
+        return False
+    try:
+        res = subprocess.run(
+            [systemd_run, "--user", "--scope", "--quiet"]
+            + ["-p", "MemoryMax=1G", "-p", "MemorySwapMax=0", "true"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=10,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug("systemd-run is unusable: %s", e)
+        return False
+    logger.debug("systemd-run scope probe exited with %s", res.returncode)
+    return res.returncode == 0
+
+
+class MemoryLimit:
+    def __init__(self, nbytes: int):
+        self.nbytes = nbytes
+
+    @property
+    def uses_cgroup(self) -> bool:
+        return systemd_run_scope_available()
+
+    def command(self, cmd: Sequence) -> list:
+        """Returns cmd, run in a memory-limited scope if possible"""
+        if not self.uses_cgroup:
+            return list(cmd)
+        return [
+            "systemd-run",
+            "--user",
+            "--scope",
+            "--quiet",
+            "-p",
+            f"MemoryMax={self.nbytes}",
+            "-p",
+            "MemorySwapMax=0",
+            "--",
+        ] + list(cmd)
+
+    def preexec(self) -> None:
+        """Sets the data size rlimit, in the child, if there's no cgroup"""
+        if self.uses_cgroup:
+            return
+        _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+        limit = (
+            self.nbytes if hard == resource.RLIM_INFINITY else min(hard, self.nbytes)
+        )
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, hard))
+
+    def exceeded(self, rss: int) -> bool:
+        return rss > self.nbytes
+
+    def is_out_of_memory(self, returncode: int, stderr: Optional[bytes]) -> bool:
+        """Returns whether a process that exited with returncode ran out of
+        memory. It was killed if it hit the cgroup's limit (or the kernel ran
+        out), and aborted if an allocation failed under the rlimit"""
+        if returncode == -signal.SIGKILL:
+            return True
+        if stderr is not None:
+            return any(
+                s in stderr
+                for s in [b"bad_alloc", b"out of memory", b"Cannot allocate memory"]
+            )
+        return returncode == -signal.SIGABRT
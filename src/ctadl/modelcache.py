@@ -0,0 +1,153 @@
+"""
+Content-addressed cache of translated model facts
+
+Translating a models file into MG_* facts is deterministic given the file's
+contents, the translator's version, whether the models are validated, and the
+first node id the translator hands out. The facts produced for each such key
+are kept as a gzipped JSON Lines file under analysiscachedir, so indexing or
+querying again with the same models splices them in instead of translating.
+
+    cache = ModelFactsCache()
+    key = cache.key(filename, first_id=1, validated=True)
+    next_id = cache.load(key, writer)  # None on a miss
+    with cache.recorder(key, writer) as w:
+        w.write("MG_Name", ...)  # writes through to writer
+        w.next_id = ...
+"""
+
+import contextlib
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import ctadl
+from ctadl import analysiscachedir
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever JSONTranslator's output for the same models changes
+TRANSLATOR_VERSION = 3
+
+
+class RecordingWriter:
+    """A facts writer that writes rows through and records them"""
+
+    def __init__(self, inner, fp):
+        self.inner = inner
+        self.fp = fp
+        self.next_id: Optional[int] = None
+
+    def write(self, name: str, *cols: Union[str, int]) -> None:
+        self.inner.write(name, *cols)
+        self.fp.write(json.dumps([name, *cols]) + "\n")
+
+
+class ModelFactsCache:
+    """Cache of the MG_* facts translated from model files
+
+    Each entry is a list of [relation, *cols] rows followed by a trailer
+    object holding the translator's next node id."""
+
+    def __init__(self, cachedir: Path = analysiscachedir / "model-facts"):
+        self.cachedir = cachedir
+
+    def key(
+        self,
+        filename: Union[str, Path],
+        *,
+        first_id: int,
+        validated: bool,
+        program: Optional[str] = None,
+    ) -> str:
+        """Returns the cache key for the facts of a models file. program is
+        a digest of the names generators were pre-filtered against, if any"""
+        algo = hashlib.sha256()
+        with open(filename, "rb") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                algo.update(block)
+        flags = dict(
+            ctadl=ctadl.__version__,
+            translator=TRANSLATOR_VERSION,
+            json5=str(filename).endswith(".json5"),
+            first_id=first_id,
+            validated=validated,
+            program=program,
+        )
+        algo.update(json.dumps(flags, sort_keys=True).encode())
+        return algo.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cachedir / f"{key}.jsonl.gz"
+
+    def load(self, key: str, writer) -> Optional[int]:
+        """Writes the cached facts for key with writer and returns the next
+        node id, or returns None if key isn't cached. An entry that can't be
+        read is removed, and treated as not cached, before any of its rows
+        are written"""
+        try:
+            fp = gzip.open(self.path(key), "rt", encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        with fp:
+            # Checks the whole entry first, so a bad one doesn't leave part of
+            # its facts written
+            try:
+                next_id = self._check(fp)
+            except (OSError, EOFError, zlib.error, ValueError) as e:
+                logger.warning("removing unreadable model facts %s: %s", key, e)
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.path(key))
+                return None
+            fp.seek(0)
+            for line in fp:
+                row = json.loads(line)
+                if isinstance(row, dict):
+                    break
+                writer.write(*row)
+        logger.debug("spliced cached model facts %s", key)
+        # Marks the entry used, for 'ctadl cache gc', which may have removed
+        # it since
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self.path(key))
+        return next_id
+
+    @staticmethod
+    def _check(fp) -> int:
+        """Reads an entry through and returns its next node id. Raises
+        ValueError if it's malformed"""
+        for line in fp:
+            row = json.loads(line)
+            if isinstance(row, dict):
+                next_id = row.get("next_id")
+                if not isinstance(next_id, int):
+                    raise ValueError("trailer has no next_id")
+                return next_id
+            if not isinstance(row, list) or not row or not isinstance(row[0], str):
+                raise ValueError(f"malformed row: {line.strip()}")
+        raise ValueError("truncated entry")
+
+    @contextlib.contextmanager
+    def recorder(self, key: str, writer) -> Iterator[RecordingWriter]:
+        """Records the rows written through the returned writer. If the
+        context exits normally, they're published under key; set next_id on
+        the writer before then"""
+        os.makedirs(self.cachedir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+        os.close(fd)
+        try:
+            with gzip.open(tmp, "wt", encoding="utf-8") as fp:
+                w = RecordingWriter(writer, fp)
+                yield w
+                assert w.next_id is not None
+                fp.write(json.dumps(dict(next_id=w.next_id)) + "\n")
+            # Publishes atomically, since other runs may be reading the cache
+            os.replace(tmp, self.path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
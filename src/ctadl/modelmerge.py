@@ -0,0 +1,129 @@
+"""
+Merging of model files
+
+Reads any number of model files one generator at a time and merges the
+generators that model the same thing: those for the same function
+("unqualified-id"), or else those with the same normalized "where" clause.
+Their model lists (propagation, sources, sinks, ...) are unioned. Memory use
+is bounded by the merged output, not by the inputs:
+
+    merger = ModelMerger()
+    for filename in filenames:
+        merger.add_file(filename)
+    with open("merged.json", "w") as fp:
+        merger.write(fp)
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import IO, Any, Union
+
+from ctadl import warn
+from ctadl.models import read_model_generators
+from ctadl.util.jsonstream import dump_object_array
+
+logger = logging.getLogger(__name__)
+
+# Constraint properties whose order doesn't matter
+_unordered = {"inners", "names", "parents"}
+
+
+def canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def normalize(constraint: Any) -> Any:
+    """Sorts the lists in a constraint that are sets"""
+    if not isinstance(constraint, dict):
+        return constraint
+    return {
+        k: (
+            sorted((normalize(c) for c in v), key=canonical)
+            if k in _unordered and isinstance(v, list)
+            else normalize(v)
+        )
+        for k, v in constraint.items()
+    }
+
+
+def generator_key(generator: dict) -> str:
+    """Returns the key under which generators are merged"""
+    where = generator.get("where", [])
+    if (
+        len(where) == 1
+        and where[0].get("constraint") == "signature_match"
+        and "unqualified-id" in where[0]
+    ):
+        return canonical([generator.get("find"), where[0]["unqualified-id"]])
+    # where is an intersection, so its order doesn't matter either
+    where = sorted((normalize(c) for c in where), key=canonical)
+    return canonical([generator.get("find"), where])
+
+
+def union(into: list, values: list) -> None:
+    """Appends the values not already in into"""
+    seen = {canonical(v) for v in into}
+    for v in values:
+        if (c := canonical(v)) not in seen:
+            seen.add(c)
+            into.append(v)
+
+
+class ModelMerger:
+    def __init__(self):
+        self.generators: dict[str, dict] = dict()
+        self.other: dict[str, Any] = dict()
+        self.num_read = 0
+        self.num_conflicts = 0
+
+    def add(self, generator: dict) -> None:
+        self.num_read += 1
+        key = generator_key(generator)
+        merged = self.generators.get(key)
+        if merged is None:
+            self.generators[key] = generator
+            return
+        model = merged.setdefault("model", dict())
+        for k, v in generator.get("model", {}).items():
+            if k not in model:
+                model[k] = v
+            elif isinstance(v, list) and isinstance(model[k], list):
+                union(model[k], v)
+            elif model[k] != v:
+                # Keeps the first
+                self.num_conflicts += 1
+                logger.debug("conflicting '%s' in %s: %s", k, key, v)
+
+    def add_other(self, other: dict[str, Any]) -> None:
+        for k, v in other.items():
+            if k not in self.other:
+                self.other[k] = v
+            elif isinstance(v, list) and isinstance(self.other[k], list):
+                union(self.other[k], v)
+
+    def add_file(self, filename: Union[str, Path]) -> None:
+        with open(filename, "rb") as fp:
+            read = read_model_generators(fp, filename)
+            if read is None:
+                warn(f"skipping '{filename}': not a JSON object")
+                return
+            generators, other = read
+            for generator in generators:
+                self.add(generator)
+            self.add_other(other)
+
+    def write(self, fp: IO[str], lines: bool = False) -> int:
+        """Writes the merged models compactly. With lines=True, writes JSON
+        Lines and omits keys other than model_generators. Returns the number
+        of generators written"""
+        if lines and self.other:
+            warn(f"omitting {', '.join(self.other)} from JSON Lines output")
+        return dump_object_array(
+            fp,
+            "model_generators",
+            self.generators.values(),
+            lines=lines,
+            separators=(",", ":"),
+            other=self.other,
+        )
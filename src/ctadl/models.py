@@ -1,14 +1,19 @@
+import contextlib
 import dataclasses
+import hashlib
 import importlib.resources as resources
 import json
 import logging
+import os
 import re
 import sqlite3
 from collections import defaultdict
 from collections.abc import Iterable
 from dataclasses import dataclass
+from functools import cached_property
 from itertools import chain, groupby
-from typing import Literal, Union
+from pathlib import Path
+from typing import IO, Any, Iterator, Literal, Optional, Union
 
 try:
     import pyjson5 as json5
@@ -16,10 +21,12 @@ except ImportError:
     import json5
 
 import ctadl
-from ctadl import progressbar, status, warn
-from ctadl.util.functions import CleanDict
+from ctadl import modelschema, progressbar, status, warn
+from ctadl.modelcache import ModelFactsCache
+from ctadl.util.functions import CleanDict, chunked
 from ctadl.util.graph import Counter
-from ctadl.vis.model import ColumnSpec, Facts, TableSpec, TempTable, execute
+from ctadl.util.jsonstream import ObjectArrayStream
+from ctadl.vis.model import ColumnSpec, Facts, execute, temp_store, tuple_cursor
 from ctadl.vis.types import SliceDirection
 
 logger = logging.getLogger(__name__)
@@ -30,6 +37,30 @@ def match_pattern(input_string, pattern) -> re.Match:
     return compiled_pattern.match(input_string)
 
 
+def read_model_generators(
+    fp: IO[bytes], filename: Union[str, Path]
+) -> Optional[tuple[Iterator[Any], dict[str, Any]]]:
+    """Reads a models file by its extension, returning an iterator over its
+    model generators and a dict of its other top-level keys, or None if it's
+    not an object
+
+    JSON files are read incrementally, so 'other' is only complete once the
+    generators are exhausted. JSON Lines (.jsonl) files hold one generator per
+    line. JSON5 files are read whole."""
+    if str(filename).endswith(".json5"):
+        models = json5.loads(fp.read().decode())
+        if not isinstance(models, dict):
+            return None
+        other = {k: v for k, v in models.items() if k != "model_generators"}
+        return iter(models.get("model_generators", [])), other
+    if str(filename).endswith(".jsonl"):
+        return (json.loads(line) for line in fp if line.strip()), dict()
+    stream = ObjectArrayStream(fp, "model_generators")
+    if not stream.is_object():
+        return None
+    return iter(stream), stream.other
+
+
 @dataclass(frozen=True)
 class JSONModelNode:
     """A JSONModelNode is part of a tree that represents evaluation criteria
@@ -40,34 +71,10 @@ class JSONModelNode:
 
 @dataclass(frozen=True)
 class OpNode(JSONModelNode):
-    op: Literal["union", "intersection"]
-    left: JSONModelNode
-    right: JSONModelNode
-
-    @staticmethod
-    def mk(
-        id: str,
-        op: Literal["union", "intersection"],
-        left: JSONModelNode,
-        right: JSONModelNode,
-    ) -> JSONModelNode:
-        if isinstance(left, NothingNode):
-            return right
-        if isinstance(right, NothingNode):
-            return left
-        if op not in ["union", "intersection"]:
-            raise ValueError("op must be union or intersection")
-        return OpNode(id=id, op=op, left=left, right=right)
-
-    @staticmethod
-    def mk_union(id: str, left: JSONModelNode, right: JSONModelNode) -> JSONModelNode:
-        return OpNode.mk(id=id, op="union", left=left, right=right)
+    """The union or intersection of any number of children"""
 
-    @staticmethod
-    def mk_intersection(
-        id: str, left: JSONModelNode, right: JSONModelNode
-    ) -> JSONModelNode:
-        return OpNode.mk(id=id, op="intersection", left=left, right=right)
+    op: Literal["union", "intersection"]
+    children: tuple[JSONModelNode, ...]
 
 
 @dataclass(frozen=True)
@@ -85,70 +92,153 @@ class NothingNode(JSONModelNode):
     pass
 
 
+class ProgramNames:
+    """The function names and namespace parents of the program being
+    analyzed, read once from CFunction_Name and CNamespace_Parent
+
+    Used to drop model generators for methods whose exact-name constraints
+    can't match anything in the program. Only positive constraints on names
+    and parents are checked, so a generator is kept whenever it might match.
+    """
+
+    def __init__(self, names: set[str], parents: set[str]):
+        self.names = names
+        self.parents = parents
+
+    @classmethod
+    def load(cls, facts: Facts) -> Optional["ProgramNames"]:
+        """Returns the names in facts, or None if it doesn't have both
+        relations"""
+        # Written by importers, so fields aren't quoted
+        names = facts.read("CFunction_Name", quoted=False)
+        parents = facts.read("CNamespace_Parent", quoted=False)
+        if names is None or parents is None:
+            return None
+        return cls({r[1] for r in names}, {r[1] for r in parents})
+
+    @cached_property
+    def digest(self) -> str:
+        algo = hashlib.sha256()
+        for s in chain(sorted(self.names), [""], sorted(self.parents)):
+            algo.update(s.encode() + b"\0")
+        return algo.hexdigest()
+
+    def may_match(self, generator) -> bool:
+        if generator.get("find") != "methods":
+            return True
+        return all(self._may_match(con) for con in generator.get("where", []))
+
+    def _may_match(self, con) -> bool:
+        constraint = con.get("constraint")
+        if constraint == "signature_match":
+            for key, known in [("name", self.names), ("parent", self.parents)]:
+                if key in con and con[key] not in known:
+                    return False
+                plural = con.get(key + "s", [])
+                if plural and known.isdisjoint(plural):
+                    return False
+            return True
+        elif constraint == "all_of":
+            return all(self._may_match(inner) for inner in con.get("inners", []))
+        elif constraint == "any_of":
+            inners = con.get("inners", [])
+            return not inners or any(self._may_match(inner) for inner in inners)
+        return True
+
+
 class JSONTranslator:
+    op_rels = {"union": "MG_AnyOf", "intersection": "MG_AllOf"}
+
     filename: str
     counter: Counter
     nothing_id: int
     nodes: set[JSONModelNode]
     nodes_output: set[JSONModelNode]
-
-    def __init__(self, facts: Facts):
+    interned: dict[tuple, JSONModelNode]
+    roots: set[str]
+
+    def __init__(self, facts: Facts, prefilter: bool = True):
+        """
+        Option arguments:
+        - prefilter: Drops generators that can't match the program, if facts
+          has its names (see ProgramNames)
+        """
         self.facts = facts
+        self.prefilter = prefilter
         self.counter = Counter(i=1)
         self.nothing_id = 0
         self.nodes = set()
         self.nodes_output = set()
         self.initialize_relations()
+        self.reset_interned()
+
+    @cached_property
+    def program_names(self) -> Optional[ProgramNames]:
+        if not self.prefilter:
+            return None
+        names = ProgramNames.load(self.facts)
+        if names is not None:
+            status(
+                f"pre-filtering models against {len(names.names)} function names "
+                f"and {len(names.parents)} parents",
+                verb=1,
+            )
+        return names
+
+    def reset_interned(self):
+        """Forgets the constraint nodes created so far, so later ones don't
+        share them"""
+        self.interned = dict()
+        self.roots = set()
+        self.interned_hits = 0
+        self.interned_misses = 0
 
     @staticmethod
     def as_port(index: int, field: str) -> str:
         return f"Argument({index}){field}"
 
     @staticmethod
-    def get_endpoint_models(conn: sqlite3.Connection):
-        name_by_var = {}
-        func_by_var = {}
-        source_models_by_var = defaultdict(list)
-        sink_models_by_var = defaultdict(list)
-        for endpoint, var, path, label, name, func in execute(
-            conn,
+    def iter_endpoint_models(conn: sqlite3.Connection) -> Iterator[dict]:
+        """Yields a model generator for each variable that's a taint source or
+        sink, reading one variable's endpoints at a time"""
+        rows = execute(
+            tuple_cursor(conn),
             """
-            SELECT endpoint, v, p, tag, vn.name, vf.function FROM (
+            SELECT v, endpoint, p, tag, vn.name, vf.function FROM (
                 SELECT 'source' AS endpoint, v, p, tag FROM TaintSourceVertex
                 UNION
                 SELECT 'sink' AS endpoint, v, p, tag FROM LeakingSinkVertex
             )
             JOIN CVar_Name vn ON (v = vn.var)
             LEFT OUTER JOIN CVar_InFunction vf ON (v = vf.var)
+            ORDER BY v
             """,
-        ):
-            name_by_var[var] = name
-            if func:
-                func_by_var[var] = func
-            models_by_var = (
-                source_models_by_var if endpoint == "source" else sink_models_by_var
-            )
-            models_by_var[var].append(CleanDict(kind=label, field=path or None))
-        generators = []
-        for var in name_by_var:
-            generators.append(
-                dict(
-                    find="variables",
-                    where=[
-                        CleanDict(
-                            constraint="signature_match",
-                            name=name_by_var[var],
-                            parent=func_by_var.get(var),
-                        )
-                        | {"unqualified-id": var}
-                    ],
-                    model=CleanDict(
-                        sources=source_models_by_var.get(var),
-                        sinks=sink_models_by_var.get(var),
-                    ),
-                )
+        )
+        for var, group in groupby(rows, key=lambda row: row[0]):
+            name, func = None, None
+            models = defaultdict(list)
+            for _, endpoint, path, label, name, vfunc in group:
+                func = vfunc or func
+                models[endpoint].append(CleanDict(kind=label, field=path or None))
+            yield dict(
+                find="variables",
+                where=[
+                    CleanDict(
+                        constraint="signature_match",
+                        name=name,
+                        parent=func,
+                    )
+                    | {"unqualified-id": var}
+                ],
+                model=CleanDict(
+                    sources=models.get("source"),
+                    sinks=models.get("sink"),
+                ),
             )
-        return dict(model_generators=generators)
+
+    @staticmethod
+    def get_endpoint_models(conn: sqlite3.Connection):
+        return dict(model_generators=list(JSONTranslator.iter_endpoint_models(conn)))
 
     @staticmethod
     def get_unmodeled_ports(conn: sqlite3.Connection):
@@ -182,95 +272,75 @@ class JSONTranslator:
         return res
 
     @staticmethod
-    def get_propagation_models(
-        conn: sqlite3.Connection,
-    ):
-        """Turns all summaries from index into model generators"""
+    def iter_propagation_models(conn: sqlite3.Connection) -> Iterator[dict]:
+        """Turns all summaries from index into model generators, yielding one
+        per function and reading one function's summaries at a time"""
 
         def handle_arg(index: int):
             if index == -1:
                 return "Return"
             return f"Argument({index})"
 
-        with TempTable(
-            conn,
-            "mg_function",
-            TableSpec(cols=[ColumnSpec("function", "TEXT NOT NULL, UNIQUE(function)")]),
-        ):
-            cur = conn.cursor()
-            execute(
-                cur,
-                f"""
-                INSERT OR IGNORE INTO "mg_function" (function)
-                SELECT m1 FROM "SummaryFlow"
-                UNION ALL SELECT m2 FROM "SummaryFlow"
-                WHERE m1 = m2 and ctx = ''
-                """,
-            )
-            conn.commit()
-            names = dict()
-            signatures = dict()
-            parents = dict()
-            for function, name, signature, parent in execute(
-                conn,
+        # Sorting the summaries may not fit in memory, where read-only
+        # connections keep temporaries, so it may spill to disk
+        with temp_store(conn, "DEFAULT"):
+            rows = execute(
+                tuple_cursor(conn),
                 """
-                SELECT mg."function", name, signature, parent FROM mg_function mg
-                JOIN CFunction_Name name ON (mg.function = name.function)
-                JOIN CFunction_Signature sig ON (mg.function = sig.function)
-                LEFT OUTER JOIN CNamespace_Parent ns ON (mg.function = ns.child)
-                """,
-            ):
-                names[function] = name
-                signatures[function] = signature
-                if parent:
-                    parents[function] = parent
-
-            # Loads summaries and groups them by function
-            models_by_func = defaultdict(list)
-            for f, dst_n, dst_ap, src_n, src_ap in execute(
-                conn,
-                """
-                SELECT m1, n1, p1, n2, p2  FROM SummaryFlow
+                SELECT m1, n1, p1, n2, p2, (
+                    SELECT name FROM CFunction_Name fn WHERE fn.function = m1
+                    LIMIT 1
+                ), (
+                    SELECT parent FROM CNamespace_Parent ns WHERE ns.child = m1
+                )
+                FROM SummaryFlow
                 WHERE m1 = m2 AND ctx = ''
+                    AND EXISTS (
+                        SELECT 1 FROM CFunction_Name fn WHERE fn.function = m1
+                    )
+                    AND EXISTS (
+                        SELECT 1 FROM CFunction_Signature sig WHERE sig.function = m1
+                    )
                 ORDER BY m1
                 """,
-            ):
-                inbase = handle_arg(src_n)
-                outbase = handle_arg(dst_n)
-                inap, outap = src_ap, dst_ap
-                models_by_func[f].append(
-                    dict(input=f"{inbase}{inap}", output=f"{outbase}{outap}")
-                )
-
-            return dict(
-                model_generators=[
-                    CleanDict(
+            )
+            try:
+                for func, group in groupby(rows, key=lambda row: row[0]):
+                    models = []
+                    for _, dst_n, dst_ap, src_n, src_ap, name, parent in group:
+                        models.append(
+                            dict(
+                                input=f"{handle_arg(src_n)}{src_ap}",
+                                output=f"{handle_arg(dst_n)}{dst_ap}",
+                            )
+                        )
+                    yield CleanDict(
                         find="methods",
                         where=[
                             CleanDict(
                                 constraint="signature_match",
-                                name=names[func],
-                                parent=parents.get(func),
+                                name=name,
+                                parent=parent,
                             )
                             | {"unqualified-id": func},
                         ],
                         model=CleanDict(propagation=models),
                     )
-                    for func, models in models_by_func.items()
-                ]
-            )
+            finally:
+                rows.close()
+
+    @staticmethod
+    def get_propagation_models(conn: sqlite3.Connection):
+        """Turns all summaries from index into model generators"""
+        return dict(model_generators=list(JSONTranslator.iter_propagation_models(conn)))
 
     def initialize_relations(self):
-        self.op_rel = self.facts.add_input_relation(
-            "MG_OpNode",
-            [ColumnSpec("nodeid", "TEXT NOT NULL"), ColumnSpec("op", "TEXT NOT NULL")],
-        )
-        self.edge_rel = self.facts.add_input_relation(
-            "MG_Edge2",
+        self.facts.add_input_relation(
+            "MG_EdgeN",
             [
                 ColumnSpec("nodeid", "TEXT NOT NULL"),
-                ColumnSpec("child1", "TEXT NOT NULL"),
-                ColumnSpec("child2", "TEXT NOT NULL"),
+                ColumnSpec("index", "INTEGER NOT NULL"),
+                ColumnSpec("child", "TEXT NOT NULL"),
             ],
         )
         self.facts.add_input_relation(
@@ -433,21 +503,34 @@ class JSONTranslator:
             [ColumnSpec("nodeid", "TEXT NOT NULL")],
         )
 
-    def atom(self, *args, **kwargs) -> Atom:
-        """Creates an atom with automatic id and adds it to internal list of
-        nodes"""
-        if "id" not in kwargs:
-            kwargs.update(dict(id=str(self.counter.increment())))
-        a = Atom(*args, **kwargs)
-        self.nodes.add(a)
-        return a
-
-    def op(self, *args, **kwargs) -> JSONModelNode:
-        assert "id" not in kwargs
-        kwargs.update(dict(id=str(self.counter.increment())))
-        o = OpNode.mk(*args, **kwargs)
-        self.nodes.add(o)
-        return o
+    def intern(self, key: tuple, mk) -> JSONModelNode:
+        """Returns the node for key, calling mk with a fresh id to create it
+        if there's none yet
+
+        Structurally identical constraints thus share a node, and it's output
+        only by the generator that created it."""
+        if (node := self.interned.get(key)) is not None:
+            self.interned_hits += 1
+            return node
+        node = mk(str(self.counter.increment()))
+        self.interned_misses += 1
+        self.interned[key] = node
+        self.nodes.add(node)
+        return node
+
+    def atom(self, **kwargs) -> Atom:
+        """Creates an atom and adds it to internal list of nodes. Atoms without
+        an explicit id are constraints and are hash-consed"""
+        if "id" in kwargs:
+            a = Atom(**kwargs)
+            self.nodes.add(a)
+            return a
+        key = (
+            kwargs["relation"],
+            tuple(kwargs.get("args", ())),
+            tuple(kwargs.get("inners", ())),
+        )
+        return self.intern(key, lambda id: Atom(id=id, **kwargs))  # type: ignore
 
     def nothing(self) -> NothingNode:
         return NothingNode(id=str(self.nothing_id))
@@ -455,15 +538,21 @@ class JSONTranslator:
     def reduce_op(
         self, op: Literal["union", "intersection"], nodes: Iterable[JSONModelNode]
     ) -> JSONModelNode:
-        """Performs associative op on the iterable of nodes and returns root
-        node"""
-        # We put a "nothing" on front...
-        node_iter = chain([self.nothing()], nodes)
-        # ... which ensures this next() call works
-        m = next(node_iter)
-        for n in node_iter:
-            m = self.op(op=op, left=n, right=m)
-        return m
+        """Performs associative op on the iterable of nodes and returns one
+        n-ary node for it"""
+        # Drops "nothing", the identity, and duplicates, since op is idempotent
+        children = tuple(
+            {n.id: n for n in nodes if not isinstance(n, NothingNode)}.values()
+        )
+        if not children:
+            return self.nothing()
+        if len(children) == 1:
+            return children[0]
+        ids = [n.id for n in children]
+        # Union is commutative. Intersection is too, but its children are
+        # evaluated in order, so that's kept as written
+        key = (op, *(sorted(ids) if op == "union" else ids))
+        return self.intern(key, lambda id: OpNode(id=id, op=op, children=children))
 
     def output_model_generator_facts(self, writer, n: JSONModelNode) -> bool:
         """Outputs a node constraint
@@ -486,8 +575,9 @@ class JSONTranslator:
             for inner_id in n.inners:
                 self.facts.write(writer, "MG_Edge1", n.id, inner_id)
         elif isinstance(n, OpNode):
-            self.facts.write(writer, self.op_rel, n.id, n.op)
-            self.facts.write(writer, self.edge_rel, n.id, n.left.id, n.right.id)
+            self.facts.write(writer, self.op_rels[n.op], n.id)
+            for i, child in enumerate(n.children):
+                self.facts.write(writer, "MG_EdgeN", n.id, i, child.id)
         return True
 
     def con_port(self, port_desc: str) -> tuple[str, str]:
@@ -865,6 +955,13 @@ class JSONTranslator:
             "intersection",
             [self.handle_constraint(con) for con in generator.get("where", [])],
         )
+        # Models are attached to the root, so generators can't share it
+        if root.id in self.roots and not isinstance(root, NothingNode):
+            root = OpNode(
+                id=str(self.counter.increment()), op="intersection", children=(root,)
+            )
+            self.nodes.add(root)
+        self.roots.add(root.id)
         self.handle_models(root, generator.get("model", {}), find=find)
         return root
 
@@ -880,54 +977,109 @@ class JSONTranslator:
             raise ValueError(f"unknown find type: {find}")
 
     def validate_models(self, instance, *, filename):
-        with resources.as_file(
-            resources.files(ctadl) / "models" / "ctadl-model-generator.schema.json"
-        ) as schema:
-            with open(schema, "rb") as fp:
-                schema = json.loads(fp.read())
-        # import fastjsonschema
-        # v = fastjsonschema.compile(schema)
-        # print(v(instance))
-
-        try:
-            from jsonschema import validate
-        except ImportError:
-            warn(f"omitting model validation, jsonschema not found")
-            return instance
-
-        status(f"validating models in '{filename}'", verb=1)
-        validate(instance=instance, schema=schema)
+        validator = modelschema.load_validator()
+        if validator is not None:
+            status(f"validating models in '{filename}'", verb=1)
+            validator.validate(instance)
         return instance
 
-    def translate(self, filename, validate: bool = True, progress=True):
+    # Number of model generators validated per chunk
+    validation_chunk_size: int = 256
+
+    def translate(
+        self,
+        filename,
+        validate: bool = True,
+        progress=True,
+        jobs: int = 1,
+        cache: bool = True,
+    ):
         """Translates a list of model_generators (in json format) and adds them
-        to the analyzer inputs"""
+        to the analyzer inputs
+
+        JSON files are read incrementally: model generators are validated in
+        chunks, 'jobs' chunks at a time in parallel, and translated as soon as
+        their chunk is valid, so memory use doesn't grow with the size of the
+        file. JSON Lines files (.jsonl, as written by 'inspect --jsonl') hold
+        one model generator per line. JSON5 files are read whole.
+
+        With 'cache', the facts are looked up in and saved to the model facts
+        cache (see ctadl.modelcache), so unchanged models aren't translated
+        again."""
 
         status(f"importing models in '{filename}'", verb=1)
-        with open(filename, "rb") as fp:
-            contents = fp.read()
-            if str(filename).endswith(".json5"):
-                models = json5.loads(contents.decode())
-            else:
-                models = json.loads(contents)
-        if not isinstance(models, dict):
-            return
-        if validate:
-            self.validate_models(models, filename=filename)
-        with progressbar(fake=not progress) as pbar:
+        # Nodes are only shared within a file, so its facts can be cached
+        self.reset_interned()
+        if not cache:
             with self.facts.writer() as writer:
-                model_generators = models.get("model_generators", [])
+                self._translate(writer, filename, validate, progress, jobs)
+            return
+        models_cache = ModelFactsCache()
+        program = self.program_names
+        key = models_cache.key(
+            filename,
+            first_id=self.counter.value,
+            validated=validate,
+            program=program.digest if program else None,
+        )
+        with self.facts.writer() as writer:
+            next_id = models_cache.load(key, writer)
+            if next_id is not None:
+                status(f"using cached facts for models in '{filename}'", verb=1)
+                self.counter.reset(next_id)
+                return
+            with models_cache.recorder(key, writer) as recorder:
+                self._translate(recorder, filename, validate, progress, jobs)
+                recorder.next_id = self.counter.value
+
+    def report_interned(self, filename):
+        total = self.interned_hits + self.interned_misses
+        if total:
+            status(
+                f"shared {self.interned_hits} of {total} constraint nodes "
+                f"({self.interned_hits / total:.0%}) in '{filename}'",
+                verb=1,
+            )
+
+    def _translate(self, writer, filename, validate, progress, jobs):
+        with open(filename, "rb") as fp:
+            total = os.fstat(fp.fileno()).st_size
+            read = read_model_generators(fp, filename)
+            if read is None:
+                return
+            generators, other = read
+            chunks = chunked(self.validation_chunk_size, generators)
+            total_generators, dropped = 0, 0
+            with contextlib.ExitStack() as stack:
+                if validate:
+                    status(f"validating models in '{filename}'", verb=1)
+                    validator = modelschema.ParallelValidator(jobs)
+                    chunks = stack.enter_context(validator).validate(chunks)
+                pbar = stack.enter_context(progressbar(fake=not progress))
                 task = pbar.add_task(
-                    description="processing model_generators",
-                    total=len(model_generators),
+                    description="processing model_generators", total=total
                 )
-                # period = update progress after that many elements
-                period, i = 1, 0
-                for i, gen in enumerate(model_generators, start=1):
-                    self.handle_model_generator(gen)  # outputs to self.nodes
-                    for n in self.nodes:
-                        self.output_model_generator_facts(writer, n)
-                    self.nodes.clear()
-                    if i % period == 0:
-                        pbar.update(task, advance=period)
-                pbar.update(task, advance=(i % period))
+                program = self.program_names
+                for _, chunk in chunks:
+                    for gen in chunk:
+                        total_generators += 1
+                        if program is not None and not program.may_match(gen):
+                            dropped += 1
+                            continue
+                        self.handle_model_generator(gen)  # outputs to self.nodes
+                        for n in self.nodes:
+                            self.output_model_generator_facts(writer, n)
+                        # Shared nodes were output by their first generator
+                        self.nodes.clear()
+                        self.nodes_output.clear()
+                    pbar.update(task, completed=fp.tell())
+            validator = modelschema.load_validator() if validate else None
+            if validator is not None:
+                validator.validate(other)
+        if dropped:
+            status(
+                f"dropped {dropped} of {total_generators} model generators that "
+                f"can't match the program in '{filename}'",
+                verb=1,
+            )
+        self.report_interned(filename)
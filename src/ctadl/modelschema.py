@@ -0,0 +1,222 @@
+"""
+Validation of model generators against ctadl-model-generator.schema.json
+
+With fastjsonschema installed, the schema is compiled to Python once and the
+generated code is cached under analysiscachedir, keyed by a hash of the
+schema, so later runs and worker processes only have to import it. Without
+fastjsonschema, falls back to jsonschema, and without that, validation is
+skipped with a warning.
+
+    validator = load_validator()
+    validator.validate(document)  # raises ModelValidationError
+    validator.validate_generators(generators, start=0)
+
+Large batches of generators can be validated in parallel with
+ParallelValidator.
+"""
+
+import concurrent.futures
+import hashlib
+import importlib.resources as resources
+import importlib.util
+import json
+import logging
+import os
+import tempfile
+from collections import deque
+from functools import cache
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+import ctadl
+from ctadl import analysiscachedir, warn
+
+logger = logging.getLogger(__name__)
+
+JSONPath = list[Union[str, int]]
+
+
+class ModelValidationError(ValueError):
+    """A model document or generator doesn't match the schema
+
+    - path: Location of the offending value, e.g. ["model_generators", 3, "find"]
+    - message: What's wrong with it
+    """
+
+    def __init__(self, message: str, path: JSONPath):
+        self.message = message
+        self.path = path
+        super().__init__(f"{format_path(path)}: {message}")
+
+    def __reduce__(self):
+        return (type(self), (self.message, self.path))
+
+
+def format_path(path: JSONPath) -> str:
+    """Formats a path like model_generators[3].where[0]"""
+    s = ""
+    for p in path:
+        s += f"[{p}]" if isinstance(p, int) else (f".{p}" if s else p)
+    return s or "<document>"
+
+
+def schema_bytes() -> bytes:
+    with resources.as_file(
+        resources.files(ctadl) / "models" / "ctadl-model-generator.schema.json"
+    ) as schema:
+        with open(schema, "rb") as fp:
+            return fp.read()
+
+
+class Validator:
+    """Validates documents against the model schema"""
+
+    backend: str
+
+    def __init__(self, validate: Callable[[Any], None], backend: str):
+        self._validate = validate
+        self.backend = backend
+
+    def validate(self, document) -> None:
+        """Raises ModelValidationError if the document is invalid"""
+        self._validate(document)
+
+    def validate_generators(self, generators: Iterable[Any], start: int = 0) -> None:
+        """Validates each of a batch of model generators. start is the index
+        of the first one in model_generators, used in error locations"""
+        for i, gen in enumerate(generators, start=start):
+            try:
+                self._validate({"model_generators": [gen]})
+            except ModelValidationError as e:
+                # Reports the generator's real position
+                raise ModelValidationError(
+                    e.message, ["model_generators", i, *e.path[2:]]
+                ) from None
+
+
+def _fastjsonschema_validator(schema: bytes, cachedir: Path) -> Callable[[Any], None]:
+    import fastjsonschema
+    from fastjsonschema.ref_resolver import RefResolver
+
+    digest = hashlib.sha256(schema + fastjsonschema.VERSION.encode()).hexdigest()
+    module_path = cachedir / f"model_schema_{digest[:16]}.py"
+    if not module_path.exists():
+        definition = json.loads(schema)
+        code = fastjsonschema.compile_to_code(definition)
+        entry = RefResolver.from_schema(definition, store={}).get_scope_name()
+        code += f"\n\nvalidate = {entry}\n"
+        # Writes atomically, since other processes may be loading it
+        os.makedirs(cachedir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cachedir, suffix=".py")
+        with os.fdopen(fd, "w") as fp:
+            fp.write(code)
+        os.replace(tmp, module_path)
+        logger.debug("compiled model schema to '%s'", module_path)
+    spec = importlib.util.spec_from_file_location(module_path.stem, module_path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    compiled = module.validate
+
+    def validate(document):
+        try:
+            compiled(document)
+        except fastjsonschema.JsonSchemaValueException as e:
+            path = [int(p) if p.isdigit() else p for p in e.path[1:]]
+            message = e.message.removeprefix(e.name).strip()
+            raise ModelValidationError(message, path) from None
+
+    return validate
+
+
+def _jsonschema_validator(schema: bytes) -> Callable[[Any], None]:
+    from jsonschema import ValidationError
+    from jsonschema.validators import validator_for
+
+    definition = json.loads(schema)
+    compiled = validator_for(definition)(definition)
+
+    def validate(document):
+        try:
+            compiled.validate(document)
+        except ValidationError as e:
+            raise ModelValidationError(e.message, list(e.path)) from None
+
+    return validate
+
+
+@cache
+def load_validator(cachedir: Path = analysiscachedir) -> Optional[Validator]:
+    """Returns the fastest available validator, or None if neither
+    fastjsonschema nor jsonschema is installed. Cached per process"""
+    schema = schema_bytes()
+    try:
+        return Validator(_fastjsonschema_validator(schema, cachedir), "fastjsonschema")
+    except ImportError:
+        pass
+    try:
+        return Validator(_jsonschema_validator(schema), "jsonschema")
+    except ImportError:
+        warn(f"omitting model validation, jsonschema not found")
+        return None
+
+
+def _validate_chunk(cachedir: Path, start: int, generators: list[Any]) -> None:
+    validator = load_validator(cachedir)
+    assert validator is not None
+    validator.validate_generators(generators, start=start)
+
+
+class ParallelValidator:
+    """Validates chunks of model generators in worker processes, keeping at
+    most 'jobs' chunks in flight. Chunks come back in order:
+
+        with ParallelValidator(jobs=4) as pv:
+            for start, chunk in pv.validate(chunks):
+                ...  # chunk is valid
+
+    Raises ModelValidationError for the first invalid generator"""
+
+    def __init__(self, jobs: int, cachedir: Path = analysiscachedir):
+        self.jobs = max(jobs, 1)
+        self.cachedir = cachedir
+        self.pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def __enter__(self):
+        # Compiles and caches the schema before the workers need it
+        if self.jobs > 1 and load_validator(self.cachedir) is not None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.jobs)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def validate(
+        self, chunks: Iterable[tuple[int, list[Any]]]
+    ) -> Iterator[tuple[int, list[Any]]]:
+        """Yields (start, chunk) for each chunk once it's validated"""
+        if self.pool is None:
+            validator = load_validator(self.cachedir)
+            for start, chunk in chunks:
+                if validator is not None:
+                    validator.validate_generators(chunk, start=start)
+                yield start, chunk
+            return
+        pending: deque = deque()
+        for start, chunk in chunks:
+            pending.append(
+                (
+                    self.pool.submit(_validate_chunk, self.cachedir, start, chunk),
+                    start,
+                    chunk,
+                )
+            )
+            if len(pending) >= self.jobs:
+                future, start, chunk = pending.popleft()
+                future.result()
+                yield start, chunk
+        while pending:
+            future, start, chunk = pending.popleft()
+            future.result()
+            yield start, chunk
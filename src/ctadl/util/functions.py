@@ -103,6 +103,10 @@ plurals = {}
 for noun in [
     NounInfo("vertex", plural="vertexes"),
     NounInfo("error", article="an"),
+    NounInfo("analysis", plural="analyses", article="an"),
+    NounInfo("entry", plural="entries", article="an"),
+    NounInfo("process", plural="processes"),
+    NounInfo("query", plural="queries"),
 ]:
     plurals[noun.singular] = noun
 
@@ -166,6 +170,16 @@ def take(n, iterable):
     return list(islice(iterable, n))
 
 
+def chunked(n, iterable):
+    "Yields (index of first item, list of up to n items) until exhausted"
+    # chunked(2, "abcde") → (0, [a, b]) (2, [c, d]) (4, [e])
+    it = iter(iterable)
+    start = 0
+    while chunk := take(n, it):
+        yield start, chunk
+        start += len(chunk)
+
+
 def takewhile(predicate, iterable):
     # takewhile(lambda x: x<5, [1,4,6,3,8]) → 1 4
     for x in iterable:
@@ -0,0 +1,167 @@
+"""
+Incremental reading and writing of large JSON documents
+
+Reads a top-level JSON object one value at a time, and the elements of one of
+its arrays one element at a time, so memory use is bounded by the largest
+element rather than by the document:
+
+    with open("models.json", "rb") as fp:
+        stream = ObjectArrayStream(fp, "model_generators")
+        for gen in stream:
+            ...  # stream.bytes_read is how far into the file we are
+        stream.other  # every other top-level key and its value
+
+dump_object_array does the reverse, writing an object with one array from an
+iterable of elements.
+"""
+
+import codecs
+import json
+from typing import IO, Any, Iterable, Iterator, Optional
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class ObjectArrayStream:
+    """Yields the elements of the array stored under 'key' in a top-level JSON
+    object. The values of the object's other keys are decoded whole and kept
+    in 'other'. Raises json.JSONDecodeError on malformed input, and ValueError
+    if the document isn't an object or 'key' isn't an array"""
+
+    chunk_size: int = 1 << 20
+
+    def __init__(self, fp: IO[bytes], key: str):
+        self.fp = fp
+        self.key = key
+        self.other: dict[str, Any] = dict()
+        self.bytes_read = 0
+        self._utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        """Appends another chunk (of size bytes, or chunk_size) to the
+        buffer, dropping what's been consumed. Returns False at end of file"""
+        if self._eof:
+            return False
+        data = self.fp.read(size or self.chunk_size)
+        self.bytes_read += len(data)
+        self._eof = not data
+        self._buf = self._buf[self._pos :] + self._utf8.decode(data, final=self._eof)
+        self._pos = 0
+        return not self._eof
+
+    def _peek(self) -> str:
+        """Skips whitespace and returns the next character, or "" at end of
+        file"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _whitespace:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        c = self._peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(
+                f"expecting one of {chars!r}", self._buf, self._pos
+            )
+        self._pos += 1
+        return c
+
+    def _value(self) -> Any:
+        """Decodes the next value, reading more of the file until it's whole.
+        Each attempt decodes the value from its start, so the chunks double
+        while it's incomplete, keeping the work linear in its size"""
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not self._eof and self._fill(size):
+                size *= 2
+                continue
+            self._pos = end
+            return value
+
+    def is_object(self) -> bool:
+        """Returns whether the document is a JSON object"""
+        return self._peek() == "{"
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._peek() != "{":
+            raise ValueError("expected a JSON object")
+        self._pos += 1
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("expecting a key", self._buf, self._pos)
+            self._expect(":")
+            if key != self.key:
+                self.other[key] = self._value()
+            else:
+                yield from self._array()
+            if self._expect(",}") == "}":
+                return
+
+    def _array(self) -> Iterator[Any]:
+        if self._peek() != "[":
+            raise ValueError(f"expected '{self.key}' to be an array")
+        self._pos += 1
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+
+def dump_object_array(
+    fp: IO[str],
+    key: str,
+    elements: Iterable[Any],
+    indent: Optional[int] = None,
+    lines: bool = False,
+    separators: Optional[tuple[str, str]] = None,
+    other: Optional[dict[str, Any]] = None,
+) -> int:
+    """Writes {**other, key: [elements...]} to fp one element at a time,
+    exactly as json.dump would. With lines=True, writes JSON Lines instead,
+    one element per line, and omits other. Returns the number of elements
+    written"""
+    n = 0
+    if lines:
+        for n, element in enumerate(elements, start=1):
+            fp.write(json.dumps(element, separators=separators) + "\n")
+        return n
+    nl = "\n" if indent is not None else ""
+    pad = " " * (indent or 0)
+    item_sep, key_sep = separators or ((", " if indent is None else ","), ": ")
+    fp.write("{")
+    for k, v in (other or {}).items():
+        text = json.dumps(v, indent=indent, separators=separators)
+        if indent is not None:
+            text = text.replace("\n", "\n" + pad)
+        fp.write(nl + pad + json.dumps(k) + key_sep + text + item_sep)
+    fp.write(nl + pad + json.dumps(key) + key_sep + "[")
+    for n, element in enumerate(elements, start=1):
+        text = json.dumps(element, indent=indent, separators=separators)
+        if indent is not None:
+            text = text.replace("\n", "\n" + pad * 2)
+        fp.write((item_sep + nl if n > 1 else nl) + pad * 2 + text)
+    fp.write((nl + pad if n else "") + "]" + nl + "}\n")
+    return n
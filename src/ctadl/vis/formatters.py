@@ -7,7 +7,7 @@ from typing import IO, Any
 
 import ctadl
 import ctadl.vis.sarif as sarif
-from ctadl.vis.model import execute
+from ctadl.vis.model import execute, require_indexes
 
 ResultType = sarif.ResultType
 
@@ -40,6 +40,7 @@ class SummaryFormatter(BaseFormatter):
         self, conn: sqlite3.Connection, file: IO[Any] = sys.stdout, **kwargs
     ) -> None:
         """Formats taint results to file"""
+        require_indexes(conn, "summary")
         num_source_labels = execute(
             conn,
             """
@@ -181,6 +182,7 @@ class SARIFFormatter(BaseFormatter):
     def print_taint_results(
         self, conn: sqlite3.Connection, file: IO[Any] = sys.stdout, **kwargs
     ) -> None:
+        require_indexes(conn, "sarif")
         con = conn
         meta = {
             "$schema": self.schema,
@@ -283,5 +285,6 @@ class SARIFFormatter(BaseFormatter):
     def print_match_results(
         self, conn: sqlite3.Connection, file: IO[Any] = sys.stdout, **kwargs
     ) -> None:
+        require_indexes(conn, "sarif")
         cx = sarif.Context(conn, self.emit_results, self.strategy)
         print(json.dumps(sarif.format_match_info(cx), indent=2), file=file)
@@ -1,18 +1,22 @@
+import atexit
 import contextlib
-import inspect
+import csv
+import gzip
+import io
 import logging
 import os
 import shutil
 import sqlite3
 import time
 import typing
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
 from functools import cache
+from itertools import chain
 from pathlib import Path
 from typing import Generic, Iterable, Iterator, Literal, Optional, Union
 
-from ctadl import status
+from ctadl import SouffleDialect, status, warn
 from ctadl.util.functions import columnize_list
 
 from .types import CtadlModelError
@@ -20,73 +24,40 @@ from .types import CtadlModelError
 logger = logging.getLogger(__name__)
 
 
-def get_last_frames(n: int):
-    # Get the current frame
-    current_frame = inspect.currentframe()
-    if current_frame is not None:
-        current_frame = current_frame.f_back
-    frames = []
-    for _ in range(n):
-        if current_frame is None:
-            break
-        frames.append(current_frame)
-        current_frame = current_frame.f_back
-    return frames
+if typing.TYPE_CHECKING:
+    from .sqlprofile import QueryProfiler
 
-
-dbstats = defaultdict(float)
+# The installed profiler, if any (see ctadl.vis.sqlprofile). When None,
+# execute and executemany add nothing beyond a debug log call.
+profiler: Optional["QueryProfiler"] = None
 
 
 def execute(
     cur: Union[sqlite3.Cursor, sqlite3.Connection],
     sql: str,
     parameters=(),
-    debug: bool = True,
-    n_frames=3,
     explain: bool = False,
 ):
     """
     Executes a sql statement with logging. Returns a cursor to the results
 
     Option arguments:
-    - debug: If on, prints the function name from the previous frame in the log
-      message
+    - explain: If on and a profiler is installed, records the query plan
     """
-    if debug:
-        frames = get_last_frames(n_frames)
-        logger.debug(
-            "%s:%s [params=%s]",
-            ":".join(frame.f_code.co_name for frame in frames),
-            sql,
-            parameters,
-        )
-
-    else:
-        logger.debug("%s", sql)
-
-    if explain:
-        for row in cur.execute(f"EXPLAIN QUERY PLAN {sql}"):
-            logger.debug("%s", list(row))
-
-    if debug:
-        start_time = time.time()
-    res = cur.execute(sql, parameters)
-    if debug:
-        end_time = time.time()
-        global dbstats
-        dbstats[sql] += end_time - start_time  # type: ignore
-    return res
+    logger.debug("%s [params=%s]", sql, parameters)
+    if profiler is not None:
+        return profiler.execute(cur, sql, parameters, explain=explain)
+    return cur.execute(sql, parameters)
 
 
 def executemany(
     cur: Union[sqlite3.Cursor, sqlite3.Connection], sql: str, parameters=()
 ):
-    """Executes a sql statement with logging
-
-    Option arguments:
-    - tr: function to translate each row in the result before returning"""
+    """Executes a sql statement with logging"""
 
     logger.debug("%s [params=%s]", sql, parameters)
+    if profiler is not None:
+        return profiler.executemany(cur, sql, parameters)
     return cur.executemany(sql, parameters)
 
 
@@ -186,72 +157,78 @@ def create_indexes(
     Does not commit to the database
     """
     for columns in colspec:
-        column_name_str = "_".join(columns)
         column_str = ", ".join(map(lambda s: '"' + s + '"', columns))
-        idx_table_args = []
-        idx_table_args.append(f'"idx_{table}_{column_name_str}"')
-        idx_ref = ".".join(idx_table_args)
-
         execute(
             conn,
             f"""
-            CREATE INDEX IF NOT EXISTS {idx_ref}
+            CREATE INDEX IF NOT EXISTS "{index_name(table, columns)}"
             ON "{table}" ({column_str})
             """,
         )
 
 
+def index_name(table: str, columns: list[str]) -> str:
+    """Returns the name create_indexes gives an index"""
+    return f'idx_{table}_{"_".join(columns)}'
+
+
+# Indexes on IR tables, for create_indexes
+IR_INDEXES: dict[str, list[list[str]]] = {
+    "__SymbolTable": [["symbol"]],
+    "_CFunction_FormalParam": [["0"], ["2"]],
+    "_CInsn_Move": [["0"], ["1"], ["3"]],
+    "_CisAlloc": [["0"], ["1"]],
+    "_CInsn_Use": [["0"]],
+    "_CCall_VirtualBase": [["0"]],
+    "_CCall_ActualParam": [["0"]],
+    "_CVar_InFunction": [["0"], ["1"]],
+    "_CInsn_InFunction": [["0"], ["1"], ["2"]],
+    "_IntCInsn_InFunction": [["0"], ["1"], ["2"]],
+    "_CFunction_Name": [["0"]],
+    "_CFunction_Arity": [["0"]],
+    "_CFunction_Signature": [["0"]],
+    "_CField_Name": [["0"]],
+    "_CInsn_Call": [["0"]],
+    "_CVar_Name": [["0"]],
+    "_CVar_Type": [["0"], ["1"]],
+    "_CNamespace_Parent": [["0"], ["1"]],
+    "_CFunction_SourceInfo": [["0", "1"]],
+    "_CInsn_SourceInfo": [["0", "1"]],
+    "_CVar_SourceInfo": [["0", "1"]],
+    "_CSourceInfo_Location": [["0"], ["1"], ["2"]],
+    "_CSourceInfo_File": [["0"], ["1"]],
+    "_CFile_UriBaseId": [["0"], ["1"]],
+    "_CSourceInfo_LineRegion": [["0"], ["1"]],
+    "_CLineRegion_StartColumn": [["0"]],
+    "_CLineRegion_EndLine": [["0"]],
+    "_CLineRegion_EndColumn": [["0"]],
+    "_CSourceInfo_CharRegion": [["0"]],
+    "_CCharRegion_Length": [["0"]],
+    "_CSourceInfo_ByteRegion": [["0"]],
+    "_CByteRegion_Length": [["0"]],
+    "_CSourceInfo_Address": [["0"]],
+    "_CAddress_AbsoluteAddress": [["0"]],
+    "_CAddress_RelativeAddress": [["0"]],
+    "_CAddress_OffsetFromParent": [["0"]],
+    "_CAddress_Length": [["0"]],
+    "_CAddress_Name": [["0"]],
+    "_CAddress_FullyQualifiedName": [["0"]],
+    "_CAddress_Kind": [["0"]],
+    "_CAddress_Parent": [["0"]],
+    "_Vertex": [["0"], ["1"]],
+    "_VirtualAssign": [["0", "1"], ["0", "3"]],
+    "_CallEdge": [["0"], ["1"]],
+    "_SummaryFlow": [["0"], ["3"]],
+    "_VirtualAlloc": [["0", "1"]],
+    "_SummaryAlloc": [["0"]],
+}
+
+
 def create_ir_indexes(conn: sqlite3.Connection):
+    """Creates every index in IR_INDEXES. Prefer require_indexes, which only
+    builds what a consumer needs"""
     cur = conn.cursor()
-    for table, colspec in [
-        ("__SymbolTable", [["symbol"]]),
-        ("_CFunction_FormalParam", [["0"], ["2"]]),
-        ("_CInsn_Move", [["0"], ["1"], ["3"]]),
-        ("_CisAlloc", [["0"], ["1"]]),
-        ("_CInsn_Use", [["0"]]),
-        ("_CCall_VirtualBase", [["0"]]),
-        ("_CCall_ActualParam", [["0"]]),
-        ("_CVar_InFunction", [["0"], ["1"]]),
-        ("_CInsn_InFunction", [["0"], ["1"], ["2"]]),
-        ("_IntCInsn_InFunction", [["0"], ["1"], ["2"]]),
-        ("_CFunction_Name", [["0"]]),
-        ("_CFunction_Arity", [["0"]]),
-        ("_CFunction_Signature", [["0"]]),
-        ("_CField_Name", [["0"]]),
-        ("_CInsn_Call", [["0"]]),
-        ("_CVar_Name", [["0"]]),
-        ("_CVar_Type", [["0"], ["1"]]),
-        ("_CNamespace_Parent", [["0"], ["1"]]),
-        ("_CFunction_SourceInfo", [["0", "1"]]),
-        ("_CInsn_SourceInfo", [["0", "1"]]),
-        ("_CVar_SourceInfo", [["0", "1"]]),
-        ("_CSourceInfo_Location", [["0"], ["1"], ["2"]]),
-        ("_CSourceInfo_File", [["0"], ["1"]]),
-        ("_CFile_UriBaseId", [["0"], ["1"]]),
-        ("_CSourceInfo_LineRegion", [["0"], ["1"]]),
-        ("_CLineRegion_StartColumn", [["0"]]),
-        ("_CLineRegion_EndLine", [["0"]]),
-        ("_CLineRegion_EndColumn", [["0"]]),
-        ("_CSourceInfo_CharRegion", [["0"]]),
-        ("_CCharRegion_Length", [["0"]]),
-        ("_CSourceInfo_ByteRegion", [["0"]]),
-        ("_CByteRegion_Length", [["0"]]),
-        ("_CSourceInfo_Address", [["0"]]),
-        ("_CAddress_AbsoluteAddress", [["0"]]),
-        ("_CAddress_RelativeAddress", [["0"]]),
-        ("_CAddress_OffsetFromParent", [["0"]]),
-        ("_CAddress_Length", [["0"]]),
-        ("_CAddress_Name", [["0"]]),
-        ("_CAddress_FullyQualifiedName", [["0"]]),
-        ("_CAddress_Kind", [["0"]]),
-        ("_CAddress_Parent", [["0"]]),
-        ("_Vertex", [["0"], ["1"]]),
-        ("_VirtualAssign", [["0", "1"], ["0", "3"]]),
-        ("_CallEdge", [["0"], ["1"]]),
-        ("_SummaryFlow", [["0"], ["3"]]),
-        ("_VirtualAlloc", [["0", "1"]]),
-        ("_SummaryAlloc", [["0"]]),
-    ]:
+    for table, colspec in IR_INDEXES.items():
         create_indexes(cur, table, colspec)
     conn.commit()
 
@@ -358,33 +335,336 @@ def create_taint_views(db: sqlite3.Connection):
     db.commit()
 
 
+# Indexes on taint tables, for create_indexes. These are critical to the
+# performance of extracting taint results
+TAINT_INDEXES: dict[str, list[list[str]]] = {
+    "_forward_flow.ReachableVertex": [["0"], ["1"]],
+    "_backward_flow.ReachableVertex": [["0"], ["1"]],
+    "_forward_flow.ReachableEdge": [["0"], ["1"], ["2"]],
+    "_backward_flow.ReachableEdge": [["0"], ["1"], ["2"]],
+    "_TaintSourceVertex": [["0"], ["1", "2"]],
+    "_LeakingSinkVertex": [["0"], ["1", "2"]],
+    "_TaintSanitizeVertex": [["0"], ["1", "2"]],
+    "_TaintSanitizeEdge": [["0"], ["1", "2"], ["3", "4"]],
+}
+
+
 def create_taint_indexes(conn: sqlite3.Connection):
-    """Creates indexes on the taint database tables. This is critical to the
-    performance of extracting taint results"""
+    """Creates every index in TAINT_INDEXES. Prefer require_indexes, which
+    only builds what a consumer needs"""
     cur = conn.cursor()
-    for table, colspec in [
-        ("_forward_flow.ReachableVertex", [["0"], ["1"]]),
-        ("_backward_flow.ReachableVertex", [["0"], ["1"]]),
-        ("_forward_flow.ReachableEdge", [["0"], ["1"], ["2"]]),
-        ("_backward_flow.ReachableEdge", [["0"], ["1"], ["2"]]),
-        ("_TaintSourceVertex", [["0"], ["1", "2"]]),
-        ("_LeakingSinkVertex", [["0"], ["1", "2"]]),
-        ("_TaintSanitizeVertex", [["0"], ["1", "2"]]),
-        ("_TaintSanitizeEdge", [["0"], ["1", "2"], ["3", "4"]]),
-    ]:
+    for table, colspec in TAINT_INDEXES.items():
         create_indexes(cur, table, colspec)
     conn.commit()
 
 
+# The tables each consumer of an index looks things up in. require_indexes
+# builds the indexes on these tables (from IR_INDEXES and TAINT_INDEXES) the
+# first time the consumer runs. Plugins may add their own entries.
+_location_tables = [
+    "_CSourceInfo_Location",
+    "_CSourceInfo_File",
+    "_CFile_UriBaseId",
+    "_CFunction_SourceInfo",
+    "_CInsn_SourceInfo",
+    "_CVar_SourceInfo",
+    "_CSourceInfo_LineRegion",
+    "_CLineRegion_StartColumn",
+    "_CLineRegion_EndLine",
+    "_CLineRegion_EndColumn",
+    "_CSourceInfo_CharRegion",
+    "_CCharRegion_Length",
+    "_CSourceInfo_ByteRegion",
+    "_CByteRegion_Length",
+    "_CSourceInfo_Address",
+    "_CAddress_AbsoluteAddress",
+    "_CAddress_RelativeAddress",
+    "_CAddress_OffsetFromParent",
+    "_CAddress_Length",
+    "_CAddress_Name",
+    "_CAddress_FullyQualifiedName",
+    "_CAddress_Kind",
+]
+_endpoint_tables = ["_TaintSourceVertex", "_LeakingSinkVertex"]
+_flow_tables = [
+    "_forward_flow.ReachableVertex",
+    "_backward_flow.ReachableVertex",
+    "_forward_flow.ReachableEdge",
+    "_backward_flow.ReachableEdge",
+]
+INDEX_CONSUMERS: dict[str, list[str]] = {
+    "summary": ["_CInsn_InFunction", *_endpoint_tables, *_flow_tables],
+    "sarif": [
+        "_CInsn_InFunction",
+        "_IntCInsn_InFunction",
+        "_CVar_InFunction",
+        "_CVar_Name",
+        "_CFunction_Name",
+        "_CFunction_FormalParam",
+        "_CCall_ActualParam",
+        "_CNamespace_Parent",
+        *_location_tables,
+        *_endpoint_tables,
+        *_flow_tables,
+    ],
+    "sarifpaths": [*_endpoint_tables, *_flow_tables],
+    "inspect": [
+        "_SummaryFlow",
+        "_CVar_Name",
+        "_CVar_InFunction",
+        "_CNamespace_Parent",
+        "_CFunction_Name",
+        "_CFunction_Signature",
+        *_endpoint_tables,
+    ],
+}
+
+# Records every index require_indexes builds
+INDEX_LOG_TABLE = "CTADLIndex"
+
+
+def missing_indexes(
+    conn: sqlite3.Connection, consumer: str
+) -> list[tuple[str, list[str]]]:
+    """Returns (table, columns) for each index consumer needs that isn't in
+    the database. Tables that don't exist, e.g., taint tables in an index
+    that hasn't been queried, are skipped"""
+    catalog = IR_INDEXES | TAINT_INDEXES
+    existing: dict[str, set[str]] = defaultdict(set)
+    for type, name in execute(
+        conn, "SELECT type, name FROM sqlite_master WHERE type IN ('table', 'index')"
+    ):
+        existing[type].add(name)
+    return [
+        (table, columns)
+        for table in INDEX_CONSUMERS[consumer]
+        if table in existing["table"]
+        for columns in catalog.get(table, [])
+        if index_name(table, columns) not in existing["index"]
+    ]
+
+
+def require_indexes(conn: sqlite3.Connection, consumer: str) -> None:
+    """
+    Builds the indexes that consumer (a key of INDEX_CONSUMERS) needs, unless
+    they already exist. Each index is built at most once per database; builds
+    are logged in CTADLIndex.
+
+    Read-only connections are supported: the indexes are built through a
+    separate, writable connection. If the database can't be written, warns
+    and carries on without the indexes.
+    """
+    missing = missing_indexes(conn, consumer)
+    if not missing:
+        return
+    status(f"building {len(missing)} indexes for {consumer}", verb=1)
+    try:
+        if getattr(conn, "readonly", False):
+            path = next(
+                file
+                for _, name, file in conn.execute("PRAGMA database_list")
+                if name == "main"
+            )
+            with DB(path) as db:
+                _build_indexes(db, consumer, missing)
+        else:
+            _build_indexes(conn, consumer, missing)
+    except sqlite3.OperationalError as e:
+        warn(f"could not build indexes for {consumer}, results may be slow: {e}")
+
+
+def _build_indexes(
+    conn: sqlite3.Connection, consumer: str, indexes: list[tuple[str, list[str]]]
+) -> None:
+    cur = conn.cursor()
+    execute(
+        cur,
+        f"""
+        CREATE TABLE IF NOT EXISTS "{INDEX_LOG_TABLE}" (
+            name TEXT PRIMARY KEY, "table" TEXT, consumer TEXT, seconds REAL
+        )
+        """,
+    )
+    for table, columns in indexes:
+        start = time.monotonic()
+        create_indexes(cur, table, [columns])
+        execute(
+            cur,
+            f'INSERT OR REPLACE INTO "{INDEX_LOG_TABLE}" VALUES (?, ?, ?, ?)',
+            (index_name(table, columns), table, consumer, time.monotonic() - start),
+        )
+        conn.commit()
+
+
+class SymbolCache:
+    """Bidirectional cache of souffle's __SymbolTable for one connection
+
+    Symbol ids never change once souffle (or we) assign them, so lookups are
+    cached for the lifetime of the connection. Lookups and insertions work on
+    batches of symbols so that a batch costs O(1) round-trips to the database
+    instead of one per symbol. The cache is a bounded LRU so that very large
+    symbol tables don't have to fit in memory.
+
+    cache = symbol_cache(conn)
+    ids = cache.intern(["foo", "bar"])  # inserts if missing
+    ids["foo"], cache.id("bar"), cache.symbol(ids["foo"])
+    """
+
+    symtab = "__SymbolTable"
+    # Max number of parameters bound to a single SELECT
+    batch_size: int = 500
+
+    def __init__(self, conn: sqlite3.Connection, maxsize: int = 1 << 20):
+        self.conn = conn
+        self.maxsize = maxsize
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self._symbols: dict[int, str] = dict()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, symbol: str):
+        return symbol in self._ids
+
+    def _add(self, symbol: str, id: int) -> None:
+        self._ids[symbol] = id
+        self._ids.move_to_end(symbol)
+        self._symbols[id] = symbol
+        while len(self._ids) > self.maxsize:
+            _, old_id = self._ids.popitem(last=False)
+            del self._symbols[old_id]
+
+    def _get(self, symbol: str) -> Optional[int]:
+        id = self._ids.get(symbol)
+        if id is not None:
+            self._ids.move_to_end(symbol)
+        return id
+
+    def prefetch(self, symbols: Iterable[str]) -> dict[str, int]:
+        """Looks up the ids of symbols, fetching uncached symbols in batches.
+        Returns the ids of the symbols that exist in the symbol table"""
+        result: dict[str, int] = dict()
+        missing = []
+        for symbol in set(symbols):
+            id = self._get(symbol)
+            if id is None:
+                missing.append(symbol)
+            else:
+                result[symbol] = id
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i : i + self.batch_size]
+            placeholders = ", ".join(["?"] * len(batch))
+            for id, symbol in execute(
+                self.conn,
+                f'SELECT id, symbol FROM "{self.symtab}" WHERE symbol IN ({placeholders})',
+                batch,
+            ):
+                self._add(symbol, id)
+                result[symbol] = id
+        return result
+
+    def intern(self, symbols: Iterable[str]) -> dict[str, int]:
+        """Inserts the symbols that aren't in the symbol table yet and returns
+        the ids of all of them. Does not commit to the database"""
+        symbols = set(symbols)
+        result = self.prefetch(symbols)
+        missing = sorted(symbols.difference(result))
+        if missing:
+            executemany(
+                self.conn,
+                f'INSERT OR IGNORE INTO "{self.symtab}" (symbol) VALUES (?)',
+                [(symbol,) for symbol in missing],
+            )
+            result.update(self.prefetch(missing))
+        return result
+
+    def id(self, symbol: str) -> int:
+        """Retrieves the unique ID of an existing symbol"""
+        ids = self.prefetch([symbol])
+        if symbol not in ids:
+            raise CtadlModelError(f"symbol not found: '{symbol}'")
+        return ids[symbol]
+
+    def symbol(self, id: int) -> str:
+        """Retrieves the symbol with the given ID"""
+        symbol = self._symbols.get(id)
+        if symbol is None:
+            symbol = fetchone_or_error(
+                execute(
+                    self.conn, f'SELECT symbol FROM "{self.symtab}" WHERE id = ?', (id,)
+                )
+            )[0]
+            self._add(symbol, id)
+        return symbol
+
+
+class Connection(sqlite3.Connection):
+    """A sqlite3 connection that carries a SymbolCache
+
+    Use with sqlite3.connect(path, factory=Connection)"""
+
+    # Set by DB for connections opened read-only
+    readonly = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.symbols = SymbolCache(self)
+
+
+def symbol_cache(conn: sqlite3.Connection) -> SymbolCache:
+    """Returns the SymbolCache attached to conn. Connections not created with
+    the Connection factory get a fresh cache each call"""
+    cache = getattr(conn, "symbols", None)
+    if cache is None:
+        cache = SymbolCache(conn)
+    return cache
+
+
+# Read-only profile. SQLite clamps mmap_size to its compile-time maximum, so
+# asking for a lot is harmless. cache_size is negative, so it's in KiB.
+READONLY_MMAP_SIZE = 1 << 34
+READONLY_CACHE_SIZE_KIB = 1 << 18
+
+
 class DB:
-    def __init__(self, path, optimize_on_close=True):
+    def __init__(self, path, optimize_on_close=True, readonly=False, immutable=False):
+        """
+        Scope for a connection to an index
+
+        Option arguments:
+        - optimize_on_close: Runs PRAGMA optimize before closing. Ignored for
+          read-only connections
+        - readonly: Opens the database with mode=ro and tunes the connection
+          for large scans: big mmap and page cache, temp tables in memory
+        - immutable: Like readonly, but also tells SQLite the file cannot
+          change, so it skips locking entirely. Only safe when no other
+          process writes the index
+        """
         self.path = path
         self.db = None
-        self.optimize_on_close = optimize_on_close
+        self.readonly = readonly or immutable
+        self.immutable = immutable
+        self.optimize_on_close = optimize_on_close and not self.readonly
+
+    def connect(self) -> "Connection":
+        if not self.readonly:
+            db = sqlite3.connect(
+                self.path, detect_types=sqlite3.PARSE_DECLTYPES, factory=Connection
+            )
+            db.row_factory = sqlite3.Row
+            return db
+        mode = "immutable=1" if self.immutable else "mode=ro"
+        uri = f"{Path(self.path).resolve().as_uri()}?{mode}"
+        db = sqlite3.connect(uri, uri=True, factory=Connection)
+        db.readonly = True
+        db.row_factory = sqlite3.Row
+        execute(db, f"PRAGMA mmap_size = {READONLY_MMAP_SIZE}")
+        execute(db, f"PRAGMA cache_size = {-READONLY_CACHE_SIZE_KIB}")
+        execute(db, "PRAGMA temp_store = MEMORY")
+        return db
 
     def __enter__(self):
-        self.db = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES)
-        self.db.row_factory = sqlite3.Row
+        self.db = self.connect()
         return self.db
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -394,6 +674,58 @@ class DB:
             self.db.close()
 
 
+# Read-only connections shared by everything in this process that reports on
+# an index, keyed by resolved path
+_readonly_connections: dict[Path, "Connection"] = {}
+
+
+def readonly_db(path) -> "Connection":
+    """
+    Returns this process's read-only connection to the index at path, opening
+    it on first use. Don't close it; it stays open until
+    close_readonly_dbs is called or the process exits.
+
+    Writes to the index are visible through the connection. Use TEMP tables
+    for scratch data.
+    """
+    key = Path(path).resolve()
+    conn = _readonly_connections.get(key)
+    if conn is None:
+        conn = _readonly_connections[key] = DB(key, readonly=True).connect()
+    return conn
+
+
+@atexit.register
+def close_readonly_dbs() -> None:
+    """Closes all connections opened by readonly_db"""
+    while _readonly_connections:
+        _, conn = _readonly_connections.popitem()
+        conn.close()
+
+
+def tuple_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+    """Returns a cursor that yields plain tuples even if conn's row_factory is
+    sqlite3.Row. Use it for loops that unpack rows; building a Row per result
+    is measurable on large indexes"""
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur
+
+
+@contextlib.contextmanager
+def temp_store(conn: sqlite3.Connection, value: str):
+    """Sets PRAGMA temp_store on conn for the body, e.g. to "DEFAULT" so large
+    sorts spill to disk on read-only connections, which keep temporaries in
+    memory. Changing it drops conn's temporary tables, so don't use it while
+    there are any"""
+    (previous,) = execute(conn, "PRAGMA temp_store").fetchone()
+    execute(conn, f"PRAGMA temp_store = {value}")
+    try:
+        yield
+    finally:
+        execute(conn, f"PRAGMA temp_store = {previous}")
+
+
 RecordTy = typing.TypeVar("RecordTy")
 
 
@@ -416,6 +748,7 @@ class SymbolTableView(Generic[RecordTy]):
         create_indexes=False,
     ):
         self.db = db
+        self.symbols = symbol_cache(db)
         self.__pre_init__(db)
         if create_indexes:
             self.create_indexes()
@@ -544,23 +877,14 @@ class SymbolTableView(Generic[RecordTy]):
         )
 
     def id(self, symbol):
-        ret = fetchone_or_error(
-            execute(
-                self.db,
-                f"SELECT id FROM {SymbolTableView.symtab} WHERE symbol = ?",
-                (symbol,),
-            )
-        )
-        return ret[0]
+        return self.symbols.id(symbol)
 
-    def insert_symbols(self, symbols: Iterable[str], commit=True):
-        executemany(
-            self.db,
-            f'INSERT OR IGNORE INTO "{SymbolTableView.symtab}" (symbol) VALUES (?)',
-            [(symbol,) for symbol in symbols],
-        )
+    def insert_symbols(self, symbols: Iterable[str], commit=True) -> dict[str, int]:
+        """Inserts symbols into the symbol table and returns their IDs"""
+        ids = self.symbols.intern(symbols)
         if commit:
             self.db.commit()
+        return ids
 
     def insert_backing_row(self, cols: tuple[int, ...], commit=True):
         """Inserts a row into the backing table of pointers into the symbol table"""
@@ -575,14 +899,7 @@ class SymbolTableView(Generic[RecordTy]):
 
     def symbol_id(self, symbol: str) -> int:
         """Retrieves the unique ID of an existing symbol"""
-        ret = fetchone_or_error(
-            execute(
-                self.db,
-                f"SELECT id FROM {SymbolTableView.symtab} WHERE symbol = ?",
-                (symbol,),
-            )
-        )
-        return ret[0]
+        return self.symbols.id(symbol)
 
 
 class CTADLConfig:
@@ -615,24 +932,29 @@ class CTADLConfig:
         execute(self.conn, f'DELETE FROM "_CTADLConfig" WHERE "0" = ?', (key_id,))
 
     def __setitem__(self, feature: str, value: str):
-        self.tab.insert_symbols([feature, value])
-        feature_id, value_id = self.tab.symbol_id(feature), self.tab.symbol_id(value)
-        if feature in self:
-            execute(
-                self.conn,
-                """
-                    UPDATE OR IGNORE "_CTADLConfig"
-                    SET "1" = :value
-                    WHERE "0" = :feature
-                    """,
-                dict(feature=feature_id, value=value_id),
-            )
-        else:
-            execute(
-                self.conn,
-                """ INSERT INTO "_CTADLConfig" ("0", "1") VALUES (?, ?) """,
-                (feature_id, value_id),
-            )
+        self.update([(feature, value)])
+
+    def update(self, pairs: Iterable[tuple[str, str]]) -> None:
+        """Sets the value of every (feature, value) pair, creating features
+        that don't exist. Costs a constant number of round-trips to the
+        database regardless of the number of pairs"""
+        features = dict(pairs)
+        if not features:
+            return
+        ids = self.tab.insert_symbols(
+            chain(features.keys(), features.values()), commit=False
+        )
+        rows = [(ids[feature], ids[value]) for feature, value in features.items()]
+        executemany(
+            self.conn,
+            """ DELETE FROM "_CTADLConfig" WHERE "0" = ? """,
+            [(feature_id,) for feature_id, _ in rows],
+        )
+        executemany(
+            self.conn,
+            """ INSERT OR IGNORE INTO "_CTADLConfig" ("0", "1") VALUES (?, ?) """,
+            rows,
+        )
         self.conn.commit()
 
     def __contains__(self, feature):
@@ -651,6 +973,165 @@ class CTADLConfig:
         return self["CTADL_ANALYSIS_LANG"]
 
 
+class SqliteFactsWriter:
+    """Buffered writer of facts into a souffle-style sqlite database
+
+    Holds a single connection for its lifetime. Rows are buffered per relation
+    and symbols are mapped to their __SymbolTable ids with the connection's
+    SymbolCache, so that flushing costs a handful of executemany calls in one
+    transaction instead of several round-trips per row.
+
+    with SqliteFactsWriter(path) as w:
+        w.write("myrelation", VAL1, VAL2)
+    """
+
+    # Number of buffered rows that triggers a flush
+    flush_threshold: int = 100000
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.rows: dict[str, list[tuple[typing.Union[str, int], ...]]] = defaultdict(
+            list
+        )
+        self.num_rows = 0
+
+    def __enter__(self):
+        self.conn = sqlite3.connect(self.path, factory=Connection)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        assert self.conn is not None
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.conn.close()
+            self.conn = None
+
+    def write(self, name: str, *cols: typing.Union[str, int]) -> None:
+        """Buffers a row for the named relation, flushing if the buffer is full"""
+        self.rows[name].append(cols)
+        self.num_rows += 1
+        if self.num_rows >= self.flush_threshold:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes all buffered rows in one transaction"""
+        assert self.conn is not None
+        if not self.num_rows:
+            return
+        symbol_ids = symbol_cache(self.conn).intern(
+            col
+            for rows in self.rows.values()
+            for row in rows
+            for col in row
+            if isinstance(col, str)
+        )
+        for name, rows in self.rows.items():
+            if not rows:
+                continue
+            valuespec = ", ".join(["?"] * len(rows[0]))
+            executemany(
+                self.conn,
+                f'INSERT OR IGNORE INTO "_{name}" VALUES ({valuespec})',
+                [
+                    tuple(
+                        (symbol_ids[col] if isinstance(col, str) else col)
+                        for col in row
+                    )
+                    for row in rows
+                ],
+            )
+        self.conn.commit()
+        self.rows.clear()
+        self.num_rows = 0
+
+
+class FactsDirWriter:
+    """Buffered writer of facts into a souffle fact directory
+
+    Rows are buffered per relation and written in batches in SouffleDialect,
+    so symbols containing tabs, quotes or newlines survive the round trip
+    (the relations must be read with rfc4180=true). With compress=True the
+    .facts files are gzip-compressed, which souffle reads transparently when
+    it's built with zlib.
+
+    with FactsDirWriter(path, ["myrelation"]) as w:
+        w.write("myrelation", VAL1, VAL2)
+    w.bytes_written["myrelation"]  # bytes of TSV written
+    """
+
+    # Number of buffered rows that triggers a flush
+    flush_threshold: int = 100000
+    compresslevel: int = 6
+
+    def __init__(
+        self,
+        path: typing.Union[str, Path],
+        relations: Iterable[str],
+        compress: bool = False,
+    ):
+        self.path = Path(path)
+        self.relations = set(relations)
+        self.compress = compress
+        self.files: dict[str, typing.BinaryIO] = dict()
+        self.rows: dict[str, list[tuple[typing.Union[str, int], ...]]] = defaultdict(
+            list
+        )
+        self.num_rows = 0
+        self.bytes_written: dict[str, int] = defaultdict(int)
+
+    def __enter__(self):
+        for name in self.relations:
+            filename = self.path / f"{name}.facts"
+            if self.compress:
+                self.files[name] = typing.cast(
+                    typing.BinaryIO,
+                    gzip.open(filename, "ab", compresslevel=self.compresslevel),
+                )
+            else:
+                self.files[name] = open(filename, "ab")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            for fp in self.files.values():
+                fp.close()
+            self.files.clear()
+        if exc_type is None:
+            self.report()
+
+    def write(self, name: str, *cols: typing.Union[str, int]) -> None:
+        """Buffers a row for the named relation, flushing if the buffer is full"""
+        self.rows[name].append(cols)
+        self.num_rows += 1
+        if self.num_rows >= self.flush_threshold:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes all buffered rows"""
+        for name, rows in self.rows.items():
+            if not rows:
+                continue
+            buf = io.StringIO()
+            csv.writer(buf, dialect=SouffleDialect).writerows(rows)
+            data = buf.getvalue().encode("utf-8")
+            self.files[name].write(data)
+            self.bytes_written[name] += len(data)
+        self.rows.clear()
+        self.num_rows = 0
+
+    def report(self) -> None:
+        """Logs the bytes written to, and the size on disk of, each relation"""
+        for name, nbytes in sorted(self.bytes_written.items()):
+            size = os.path.getsize(self.path / f"{name}.facts")
+            status(f"{name}.facts: wrote {nbytes} bytes, {size} on disk", verb=2)
+
+
 class Facts:
     """Interface to a facts dir or sqlite database
 
@@ -668,9 +1149,14 @@ class Facts:
     path: Path
     ty: Literal["dir", "sqlite"]
 
-    def __init__(self, path: typing.Union[str, Path]):
+    def __init__(self, path: typing.Union[str, Path], compress: bool = False):
+        """
+        Option arguments:
+        - compress: gzip-compresses the relations written to a facts dir
+        """
         self.path = path if isinstance(path, Path) else Path(path)
         self.ty = "dir" if self.path.is_dir() else "sqlite"
+        self.compress = compress
         # The writer that we return for a facts directory is a map of writers
         # to each individual file. To be able to do that, we need to remember
         # the set of relation names.
@@ -753,50 +1239,60 @@ class Facts:
 
     @contextlib.contextmanager
     def writer(self):
-        fps = {}
-        if self.is_fact_dir:
-            fps = {name: self._open_facts_dir_relation(name) for name in self.relations}
-        try:
-            yield fps
-        finally:
-            for fp in fps.values():
-                fp.close()
+        """Returns a writer for use with 'write'
+
+        The writer buffers rows. For a sqlite database, it holds one connection
+        open for the duration of the context and rows are committed on exit.
+        For a facts dir, see FactsDirWriter."""
+        if self.is_sqlite_db:
+            with SqliteFactsWriter(self.path) as w:
+                yield w
+            return
+        with FactsDirWriter(self.path, self.relations, self.compress) as w:
+            yield w
+
+    def read(self, name: str, quoted: bool = True) -> Optional[Iterator[tuple]]:
+        """Returns an iterator over the rows of the named relation, or None if
+        there's no such relation. Rows of a facts dir are all strings
+
+        Optional arguments:
+        - quoted: Whether a facts dir's file is in SouffleDialect, as
+          FactsDirWriter writes it. Pass False for relations written by
+          importers, which are plain tab-separated lines"""
+        if not self.path.exists():
+            return None
+        if self.is_sqlite_db:
+            conn = readonly_db(self.path)
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+            ).fetchone()
+            if not exists:
+                return None
+            return iter(tuple_cursor(conn).execute(f'SELECT * FROM "{name}"'))
+        filename = self.path / f"{name}.facts"
+        if not filename.exists():
+            return None
+        with open(filename, "rb") as fp:
+            compressed = fp.read(2) == b"\x1f\x8b"
+        opener = gzip.open if compressed else open
+        fp = opener(filename, "rt", encoding="utf-8", newline="")
+        return self._read_facts_file(fp, quoted)
+
+    @staticmethod
+    def _read_facts_file(fp, quoted: bool) -> Iterator[tuple]:
+        with fp:
+            if quoted:
+                for row in csv.reader(fp, dialect=SouffleDialect):
+                    yield tuple(row)
+            else:
+                for line in fp:
+                    yield tuple(line.rstrip("\r\n").split("\t"))
 
     def write(self, writers, name: str, *cols: typing.Union[str, int]) -> None:
         """Writes a fact to the named relation
 
         The 'writer' argument is returned by using the context manager 'self.writer'"""
-        if self.is_fact_dir:
-            print(
-                *cols,
-                sep="\t",
-                file=writers[name],
-            )
-        else:
-            with sqlite3.connect(self.path) as db:
-                db.executemany(
-                    f'INSERT OR IGNORE INTO "__SymbolTable" ("symbol") VALUES (?)',
-                    list((col,) for col in list(cols) if isinstance(col, str)),
-                )
-                db.commit()
-                wherespec = " OR ".join(
-                    f"symbol = '{col}'" for col in list(cols) if isinstance(col, str)
-                )
-                symbolid = {
-                    row[1]: row[0]
-                    for row in db.execute(
-                        f'SELECT id, symbol FROM "__SymbolTable" WHERE {wherespec}'
-                    ).fetchall()
-                }
-                valuespec = ", ".join(["?"] * len(cols))
-                db.execute(
-                    f'INSERT INTO "_{name}" VALUES ({valuespec})',
-                    tuple(
-                        (symbolid[col] if isinstance(col, str) else col)
-                        for col in list(cols)
-                    ),
-                )
-                db.commit()
+        writers.write(name, *cols)
 
 
 def create_tainted_arg_unresolved(
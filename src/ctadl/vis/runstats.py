@@ -0,0 +1,371 @@
+"""
+Records the resources used by the subprocesses of a ctadl run.
+
+Every subprocess that ctadl spawns (the preprocessor, souffle, the C++
+compiler it drives, compiled analyses) is sampled while it runs: resident
+memory, CPU time, I/O bytes and threads. The samples go into a time series
+per process, along with its peaks and totals, which are written to a JSON
+sidecar and stored in the CTADLRunStats table of the index:
+
+    stats = runstats.recorder.begin("souffle", cmd, process.pid)
+    stats.sample()  # periodically, while it runs
+    stats.finish(retcode, rusage)
+    runstats.recorder.write(sidecar_path, "index")
+    runstats.store(conn, "index", runstats.recorder.processes)
+
+Samples use psutil if it's installed and /proc otherwise, and include the
+children of the process. The totals come from the process's rusage when it
+exits, which covers the children it waited for.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+from ctadl.vis import model
+
+logger = logging.getLogger(__name__)
+
+RUNSTATS_TABLE = "CTADLRunStats"
+
+# Seconds between samples of a running process
+sample_interval_s = 1.0
+
+# Units of ru_maxrss, in bytes
+maxrss_unit = 1 if platform.system() == "Darwin" else 1024
+
+
+@dataclass
+class Sample:
+    seconds: float  # since the process started
+    rss: int
+    cpu_seconds: float
+    read_bytes: int
+    write_bytes: int
+    threads: int
+
+
+def _sample_psutil(pid: int) -> Optional[tuple]:
+    import psutil
+
+    try:
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return None
+    rss, cpu, read, write, threads = 0, 0.0, 0, 0, 0
+    for p in procs:
+        try:
+            with p.oneshot():
+                rss += p.memory_info().rss
+                times = p.cpu_times()
+                cpu += times.user + times.system
+                threads += p.num_threads()
+                try:
+                    io = p.io_counters()
+                    read += io.read_bytes
+                    write += io.write_bytes
+                except (AttributeError, psutil.AccessDenied):
+                    pass
+        except psutil.NoSuchProcess:
+            # Children exit between listing and sampling them
+            if p is root:
+                return None
+    return rss, cpu, read, write, threads
+
+
+def _proc_children(pid: int) -> list[int]:
+    """Returns the children of pid, if the kernel lists them in /proc"""
+    children = []
+    try:
+        for task in os.scandir(f"/proc/{pid}/task"):
+            with open(os.path.join(task.path, "children"), "r") as fp:
+                children.extend(int(c) for c in fp.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def _sample_proc(pid: int) -> Optional[tuple]:
+    values = _sample_proc_1(pid)
+    if values is None:
+        return None
+    for child in _proc_children(pid):
+        child_values = _sample_proc(child)
+        if child_values is not None:
+            values = tuple(a + b for a, b in zip(values, child_values))
+    return values
+
+
+def _sample_proc_1(pid: int) -> Optional[tuple]:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as fp:
+            stat = fp.read()
+    except OSError:
+        return None
+    # The command name in parens may contain spaces, so split after it. The
+    # first field after it is field 3 of proc(5)
+    fields = stat.rsplit(")", 1)[-1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    threads = int(fields[17])
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    read, write = 0, 0
+    try:
+        with open(f"/proc/{pid}/io", "r") as fp:
+            io = dict(line.split(":", 1) for line in fp if ":" in line)
+        read, write = int(io.get("read_bytes", 0)), int(io.get("write_bytes", 0))
+    except OSError:
+        pass
+    return rss, cpu, read, write, threads
+
+
+def sample_process(pid: int, seconds: float) -> Optional[Sample]:
+    """Samples the resources of pid, or returns None if they can't be read"""
+    try:
+        values = _sample_psutil(pid)
+    except ImportError:
+        values = _sample_proc(pid)
+    except Exception as e:
+        logger.debug("cannot sample process %s: %s", pid, e)
+        return None
+    return Sample(seconds, *values) if values is not None else None
+
+
+@dataclass
+class ProcessStats:
+    name: str
+    command: str
+    start: float  # unix time
+    seconds: float = 0.0
+    returncode: Optional[int] = None
+    cpu_seconds: float = 0.0
+    peak_rss: int = 0
+    peak_threads: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    samples: list[Sample] = field(default_factory=list)
+    pid: Optional[int] = field(default=None, repr=False)
+
+    def sample(self) -> None:
+        if self.pid is None:
+            return
+        s = sample_process(self.pid, time.time() - self.start)
+        if s is None:
+            return
+        self.samples.append(s)
+        self.peak_rss = max(self.peak_rss, s.rss)
+        self.peak_threads = max(self.peak_threads, s.threads)
+
+    def finish(
+        self, returncode: int, rusage: Optional[resource.struct_rusage] = None
+    ) -> None:
+        """Fills in the totals. rusage is that of the process, if it was
+        reaped with wait4, which covers everything it ran"""
+        self.seconds = time.time() - self.start
+        self.returncode = returncode
+        self.pid = None
+        if self.samples:
+            last = self.samples[-1]
+            self.cpu_seconds = last.cpu_seconds
+            self.read_bytes, self.write_bytes = last.read_bytes, last.write_bytes
+        if rusage is not None:
+            self.cpu_seconds = max(self.cpu_seconds, rusage.ru_utime + rusage.ru_stime)
+            self.peak_rss = max(self.peak_rss, rusage.ru_maxrss * maxrss_unit)
+            # Block counts are in 512-byte units
+            self.read_bytes = max(self.read_bytes, rusage.ru_inblock * 512)
+            self.write_bytes = max(self.write_bytes, rusage.ru_oublock * 512)
+
+    def to_json(self) -> dict:
+        d = asdict(self)
+        del d["pid"]
+        return d
+
+
+def wait(process: subprocess.Popen, timeout: float) -> Optional[resource.struct_rusage]:
+    """Like process.wait(timeout), but reaps the process with wait4 to return
+    its resource usage. Raises subprocess.TimeoutExpired if it's still
+    running after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        except ChildProcessError:
+            # Already reaped, by process.poll() for example
+            process.wait()
+            return None
+        if pid == process.pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+
+
+def summarize(processes: Sequence[ProcessStats]) -> dict:
+    """Returns the peaks and totals over processes"""
+    return dict(
+        processes=len(processes),
+        seconds=sum(p.seconds for p in processes),
+        cpu_seconds=sum(p.cpu_seconds for p in processes),
+        peak_rss=max((p.peak_rss for p in processes), default=0),
+        peak_threads=max((p.peak_threads for p in processes), default=0),
+        read_bytes=sum(p.read_bytes for p in processes),
+        write_bytes=sum(p.write_bytes for p in processes),
+    )
+
+
+class RunStats:
+    """The processes run so far, in the order they started. Safe to use from
+    several threads"""
+
+    def __init__(self):
+        self.processes: list[ProcessStats] = []
+        self._lock = threading.Lock()
+
+    def begin(self, name: str, command: Sequence, pid: Optional[int]) -> ProcessStats:
+        stats = ProcessStats(name, " ".join(map(str, command)), time.time(), pid=pid)
+        with self._lock:
+            self.processes.append(stats)
+        return stats
+
+    @contextlib.contextmanager
+    def measure(self, name: str, command: Sequence) -> Iterator[ProcessStats]:
+        """Records the subprocesses that the body runs without ctadl's
+        Command, such as import plugins, as one process. Only the totals are
+        known, from the difference in the rusage of our children"""
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        stats = self.begin(name, command, pid=None)
+        try:
+            yield stats
+        finally:
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            stats.finish(stats.returncode if stats.returncode is not None else 0)
+            stats.cpu_seconds = (after.ru_utime + after.ru_stime) - (
+                before.ru_utime + before.ru_stime
+            )
+            # ru_maxrss is the largest of all our children so far, so it's
+            # only theirs if it grew
+            if after.ru_maxrss > before.ru_maxrss:
+                stats.peak_rss = after.ru_maxrss * maxrss_unit
+            stats.read_bytes = (after.ru_inblock - before.ru_inblock) * 512
+            stats.write_bytes = (after.ru_oublock - before.ru_oublock) * 512
+
+    def to_json(self, phase: str) -> dict:
+        with self._lock:
+            processes = list(self.processes)
+        return dict(
+            phase=phase,
+            sample_interval_s=sample_interval_s,
+            totals=summarize(processes),
+            processes=[p.to_json() for p in processes],
+        )
+
+    def write(self, path: Path, phase: str) -> None:
+        with open(path, "w") as fp:
+            json.dump(self.to_json(phase), fp, indent=1)
+
+
+# The processes of this run of ctadl
+recorder = RunStats()
+
+
+def sidecar_path(directory: Path, stem: str, phase: str) -> Path:
+    """Returns where the run stats of phase are written next to an output"""
+    return directory / f"{stem}-{phase}.runstats.json"
+
+
+def read_sidecar(path: Path) -> Optional[list[ProcessStats]]:
+    """Reads the processes in a sidecar, or returns None if it's missing or
+    malformed"""
+    try:
+        with open(path, "r") as fp:
+            doc = json.load(fp)
+        return [
+            ProcessStats(
+                **{
+                    **p,
+                    "samples": [Sample(**s) for s in p.get("samples", [])],
+                }
+            )
+            for p in doc["processes"]
+        ]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.debug("cannot read run stats %s: %s", path, e)
+        return None
+
+
+def store(
+    conn: sqlite3.Connection, phase: str, processes: Sequence[ProcessStats]
+) -> None:
+    """Replaces the run stats of phase in the index. The samples of each
+    process are stored as a JSON list"""
+    cur = conn.cursor()
+    model.execute(
+        cur,
+        f"""
+        CREATE TABLE IF NOT EXISTS "{RUNSTATS_TABLE}" (
+            phase TEXT, name TEXT, command TEXT, start REAL, seconds REAL,
+            returncode INTEGER, cpu_seconds REAL, peak_rss INTEGER,
+            peak_threads INTEGER, read_bytes INTEGER, write_bytes INTEGER,
+            samples TEXT
+        )
+        """,
+    )
+    model.execute(cur, f'DELETE FROM "{RUNSTATS_TABLE}" WHERE phase = ?', (phase,))
+    model.executemany(
+        cur,
+        f'INSERT INTO "{RUNSTATS_TABLE}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            (
+                phase,
+                p.name,
+                p.command,
+                p.start,
+                p.seconds,
+                p.returncode,
+                p.cpu_seconds,
+                p.peak_rss,
+                p.peak_threads,
+                p.read_bytes,
+                p.write_bytes,
+                json.dumps([asdict(s) for s in p.samples]),
+            )
+            for p in processes
+        ],
+    )
+    conn.commit()
+
+
+def load(conn: sqlite3.Connection) -> dict[str, list[ProcessStats]]:
+    """Returns the run stats in the index by phase, in the order the
+    processes started"""
+    exists = model.execute(
+        conn,
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (RUNSTATS_TABLE,),
+    ).fetchone()
+    if not exists:
+        return dict()
+    result: dict[str, list[ProcessStats]] = dict()
+    for row in model.execute(conn, f'SELECT * FROM "{RUNSTATS_TABLE}" ORDER BY start'):
+        phase, *values, samples = row
+        result.setdefault(phase, []).append(
+            ProcessStats(*values, samples=[Sample(**s) for s in json.loads(samples)])
+        )
+    return result
@@ -43,6 +43,7 @@ from ctadl.vis.model import (
     create_indexes,
     execute,
     executemany,
+    tuple_cursor,
 )
 from ctadl.vis.taintgraph import TaintGraph, TaintGraphEdgeInput
 from ctadl.vis.types import (
@@ -345,7 +346,7 @@ def format_run_info(cx: Context) -> dict:
     _load_taint_set(cx)
 
     info = cx._info
-    cur = cx.conn.cursor()
+    cur = tuple_cursor(cx.conn)
 
     # Populated with the various SARIF result types we support
     sarif_results: list[Result] = []
@@ -500,7 +501,7 @@ def format_run_info(cx: Context) -> dict:
 
 def format_match_info(cx: Context) -> list[Result]:
     """Returns a list of SARIF results"""
-    cur = cx.conn.cursor()
+    cur = tuple_cursor(cx.conn)
     info = cx._info
     _prepare(cx)
     execute(cur, """INSERT OR IGNORE INTO tainted_insn SELECT insn FROM Match_Insn""")
@@ -843,7 +844,7 @@ def _var_context(
 
 def _load_taint_set(cx: Context):
     _prepare(cx)
-    cur = cx.conn.cursor()
+    cur = tuple_cursor(cx.conn)
     info = cx._info
 
     for (index,) in execute(cur, """SELECT "index" FROM CReturnParameter"""):
@@ -995,11 +996,11 @@ def _load_taint_set(cx: Context):
 
 def _load_taint_graph(cx: Context, dir: SliceDirection):
     """Loads either the forward or backward graph"""
-    cur = cx.conn.cursor()
+    cur = tuple_cursor(cx.conn)
     flow = "forward_flow" if dir.is_forward() else "backward_flow"
     edge_iter = (
-        TaintGraphEdgeInput(src=row["src"], dst=row["dst"])
-        for row in execute(
+        TaintGraphEdgeInput(src=src, dst=dst)
+        for src, dst in execute(
             cur,
             (
                 f"""
@@ -1053,7 +1054,7 @@ def _load_taint_graph(cx: Context, dir: SliceDirection):
 
 
 def _make_logical_locations(cx: Context):
-    cur = cx.conn.cursor()
+    cur = tuple_cursor(cx.conn)
     for var, name in execute(
         cur,
         """
@@ -1326,7 +1327,7 @@ def _populate_taintset(cx: Context):
     # Restricts populating temporary tables, either by the common case -- which
     # is just returning path results -- or generally by the total reachable
     # set
-    cur = cx.conn.cursor()
+    cur = tuple_cursor(cx.conn)
     paths = cx._info.paths
     logger.debug("result_types: %s", cx.result_types)
     if set(["path_result"]) == cx.result_types:
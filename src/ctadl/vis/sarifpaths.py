@@ -15,7 +15,15 @@ import sqlite3
 from pprint import pformat
 from typing import Collection, Iterable, Iterator, NamedTuple, Optional, Union
 
-from ctadl.vis.model import ColumnSpec, TableSpec, TempTable, execute, executemany
+from ctadl.vis.model import (
+    ColumnSpec,
+    TableSpec,
+    TempTable,
+    execute,
+    executemany,
+    require_indexes,
+    tuple_cursor,
+)
 from ctadl.vis.taintgraph import (
     Path,
     SemiNaiveMinPathLength,
@@ -37,10 +45,12 @@ def find_paths(
     Both the forward and backward taint graphs are searched.
     """
 
+    require_indexes(conn, "sarifpaths")
+    cur = tuple_cursor(conn)
     sources: list[VertexId] = [
         id
         for (id,) in execute(
-            conn,
+            cur,
             """
             SELECT id from "flow.ReachableVertex" v
             JOIN TaintSourceVertex source ON (v.v1 = source.v AND v.p1 = source.p)
@@ -50,7 +60,7 @@ def find_paths(
     sinks: list[VertexId] = [
         id
         for (id,) in execute(
-            conn,
+            cur,
             """
             SELECT id from "flow.ReachableVertex" v
             JOIN LeakingSinkVertex sink ON (v.v1 = sink.v AND v.p1 = sink.p)
@@ -75,7 +85,7 @@ def find_paths(
             vertices_ids = [
                 id
                 for (id,) in execute(
-                    conn,
+                    cur,
                     f"""
                     SELECT id FROM "vertex_input"
                     JOIN "flow.ReachableVertex" rv USING (v1, p1)
@@ -104,7 +114,7 @@ def find_paths(
                     )
                     path_on_vertices = []
                     for v, p in execute(
-                        conn,
+                        cur,
                         f"""
                         SELECT v1, p1 FROM "flow.ReachableVertex"
                         JOIN (
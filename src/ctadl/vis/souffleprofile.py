@@ -0,0 +1,182 @@
+"""
+Reads Souffle profile logs and keeps them in the index.
+
+Souffle writes a profile log (as JSON) when run with '-p <file>'. The log
+nests the runtime and tuple count of every relation, every non-recursive
+rule, and every recursive rule in every iteration of its stratum. This module
+flattens that into one row per relation and per rule, summing over
+iterations, and stores the rows in the CTADLProfile table:
+
+    rows = souffleprofile.read_log("index-profile.log")
+    souffleprofile.store(conn, "index", rows)
+    souffleprofile.print_report(souffleprofile.load(conn), sys.stdout)
+"""
+
+import json
+import logging
+import shutil
+import sqlite3
+import sys
+from dataclasses import dataclass
+from typing import IO, Any, Iterable, Optional, Union
+
+from ctadl.vis import model
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TABLE = "CTADLProfile"
+
+
+@dataclass
+class ProfileRow:
+    phase: str
+    kind: str  # "relation" or "rule"
+    relation: str
+    rule: str
+    seconds: float
+    tuples: int
+    locator: str = ""
+
+
+def _seconds(entry: Any) -> float:
+    """Returns the duration of a runtime entry, which Souffle writes as start
+    and end in microseconds"""
+    if isinstance(entry, dict) and "start" in entry and "end" in entry:
+        return max(entry["end"] - entry["start"], 0) / 1e6
+    return 0.0
+
+
+def _values(entries: Union[dict, list]) -> Iterable:
+    return entries.values() if isinstance(entries, dict) else entries
+
+
+def _add_rules(rules: dict[str, list], entries: dict) -> None:
+    """Accumulates [seconds, tuples, locator] per rule. Recursive rules are
+    nested one level deeper, under their version"""
+    for rule, entry in entries.items():
+        if not isinstance(entry, dict):
+            continue
+        if "runtime" not in entry and "num-tuples" not in entry:
+            for version in entry.values():
+                _add_rules(rules, {rule: version})
+            continue
+        acc = rules.setdefault(rule, [0.0, 0, ""])
+        acc[0] += _seconds(entry.get("runtime"))
+        acc[1] += int(entry.get("num-tuples", 0))
+        acc[2] = acc[2] or entry.get("source-locator", "")
+
+
+def parse(doc: dict, phase: str) -> list[ProfileRow]:
+    """Flattens a Souffle profile log into rows"""
+    relations = doc.get("root", {}).get("program", {}).get("relation", {})
+    rows = []
+    for relation, entry in relations.items():
+        rules: dict[str, list] = dict()
+        _add_rules(rules, entry.get("non-recursive-rule", {}))
+        seconds = _seconds(entry.get("runtime"))
+        tuples = int(entry.get("num-tuples", 0))
+        for iteration in _values(entry.get("iteration", {})):
+            _add_rules(rules, iteration.get("recursive-rule", {}))
+            seconds += _seconds(iteration.get("runtime"))
+            tuples += int(iteration.get("num-tuples", 0))
+        locator = entry.get("source-locator", "")
+        rows.append(
+            ProfileRow(phase, "relation", relation, "", seconds, tuples, locator)
+        )
+        for rule, (rule_seconds, rule_tuples, rule_locator) in rules.items():
+            rows.append(
+                ProfileRow(
+                    phase,
+                    "rule",
+                    relation,
+                    " ".join(rule.split()),
+                    rule_seconds,
+                    rule_tuples,
+                    rule_locator,
+                )
+            )
+    return rows
+
+
+def read_log(filename: str, phase: str) -> Optional[list[ProfileRow]]:
+    """Parses the profile log in filename, or returns None if it's missing or
+    malformed"""
+    try:
+        with open(filename, "r") as fp:
+            doc = json.load(fp)
+    except FileNotFoundError:
+        logger.debug("no souffle profile log at %s", filename)
+        return None
+    except json.JSONDecodeError as e:
+        logger.debug("cannot parse souffle profile log %s: %s", filename, e)
+        return None
+    return parse(doc, phase)
+
+
+def store(conn: sqlite3.Connection, phase: str, rows: list[ProfileRow]) -> None:
+    """Replaces the profile of phase in the index"""
+    cur = conn.cursor()
+    model.execute(
+        cur,
+        f"""
+        CREATE TABLE IF NOT EXISTS "{PROFILE_TABLE}" (
+            phase TEXT, kind TEXT, relation TEXT, rule TEXT, seconds REAL,
+            tuples INTEGER, locator TEXT
+        )
+        """,
+    )
+    model.execute(cur, f'DELETE FROM "{PROFILE_TABLE}" WHERE phase = ?', (phase,))
+    model.executemany(
+        cur,
+        f'INSERT INTO "{PROFILE_TABLE}" VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [
+            (r.phase, r.kind, r.relation, r.rule, r.seconds, r.tuples, r.locator)
+            for r in rows
+        ],
+    )
+    conn.commit()
+
+
+def load(conn: sqlite3.Connection) -> list[ProfileRow]:
+    """Returns the profile rows in the index, most expensive first"""
+    exists = model.execute(
+        conn,
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (PROFILE_TABLE,),
+    ).fetchone()
+    if not exists:
+        return []
+    return [
+        ProfileRow(*row)
+        for row in model.execute(
+            conn,
+            f'SELECT * FROM "{PROFILE_TABLE}" ORDER BY seconds DESC, tuples DESC',
+        )
+    ]
+
+
+def print_report(
+    rows: list[ProfileRow], file: IO[str] = sys.stdout, limit: int = 20
+) -> None:
+    """Prints the 'limit' most expensive relations and rules of each phase"""
+    displaywidth, _ = shutil.get_terminal_size((120, 24))
+    for phase in sorted({r.phase for r in rows}):
+        for kind in ["relation", "rule"]:
+            ranked = [r for r in rows if r.phase == phase and r.kind == kind]
+            if not ranked:
+                continue
+            total = sum(r.seconds for r in ranked)
+            print(
+                f"{phase} profile: {len(ranked)} {kind}s, {total:.2f}s total",
+                file=file,
+            )
+            header = f"{'seconds':>9} {'tuples':>12}  {kind}"
+            print(header, file=file)
+            width = max(displaywidth - len(header) + len(kind), 40)
+            for r in ranked[:limit]:
+                name = r.rule or r.relation
+                name = name if len(name) <= width else name[: width - 3] + "..."
+                print(f"{r.seconds:9.3f} {r.tuples:12d}  {name}", file=file)
+                if r.locator:
+                    print(f"{'':24}at {r.locator}", file=file)
+            print(file=file)
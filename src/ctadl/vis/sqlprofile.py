@@ -0,0 +1,210 @@
+"""
+Profiles the SQL statements that CTADL runs against an index.
+
+Profiling is off by default and costs nothing when off: model.execute only
+checks whether a profiler is installed. The usage model is:
+
+    profiler = sqlprofile.enable(explain=True)
+    ...  # anything that calls model.execute or model.executemany
+    profiler.print_report(sys.stderr)
+    profiler.write_json("sql-profile.json")
+
+For every distinct statement the profiler records the number of calls, the
+wall time spent executing it and fetching its results, the number of rows
+returned, the call sites, and (optionally) its EXPLAIN QUERY PLAN.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import IO, Any, Optional, Union
+
+from ctadl.vis import model
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StatementStats:
+    sql: str
+    calls: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+    call_sites: Counter = dataclasses.field(default_factory=Counter)
+    plan: Optional[list[str]] = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            sql=self.sql,
+            calls=self.calls,
+            seconds=self.seconds,
+            rows=self.rows,
+            call_sites=dict(self.call_sites.most_common()),
+            plan=self.plan,
+        )
+
+
+class ProfiledCursor:
+    """Wraps a cursor so that the time spent fetching rows, and the number of
+    rows fetched, are attributed to the statement that produced them"""
+
+    def __init__(self, cursor: sqlite3.Cursor, stats: StatementStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        finally:
+            self._stats.seconds += time.perf_counter() - start
+        self._stats.rows += 1
+        return row
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._stats.seconds += time.perf_counter() - start
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._stats.seconds += time.perf_counter() - start
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._stats.seconds += time.perf_counter() - start
+        self._stats.rows += len(rows)
+        return rows
+
+
+class QueryProfiler:
+    """Accumulates per-statement statistics. Install with 'enable'"""
+
+    stats: dict[str, StatementStats]
+
+    def __init__(self, explain: bool = False):
+        """
+        Optional arguments:
+        - explain: Records the EXPLAIN QUERY PLAN of each statement the first
+          time it is executed
+        """
+        self.explain = explain
+        self.stats = dict()
+        self.start_time = time.time()
+
+    def _statement(self, sql: str) -> StatementStats:
+        key = " ".join(sql.split())
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = StatementStats(sql=key)
+        return stats
+
+    @staticmethod
+    def _call_site() -> str:
+        # Skips this function, QueryProfiler.execute, and model.execute
+        frame = sys._getframe(3)
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{frame.f_lineno}:{code.co_name}"
+
+    def _explain(self, cur, stats: StatementStats, sql: str, parameters) -> None:
+        try:
+            stats.plan = [
+                str(row[-1])
+                for row in cur.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            ]
+        except sqlite3.Error as e:
+            logger.debug("cannot explain %s: %s", sql, e)
+            stats.plan = []
+
+    def execute(
+        self,
+        cur: Union[sqlite3.Cursor, sqlite3.Connection],
+        sql: str,
+        parameters=(),
+        explain: bool = False,
+    ) -> ProfiledCursor:
+        stats = self._statement(sql)
+        stats.calls += 1
+        stats.call_sites[self._call_site()] += 1
+        if (self.explain or explain) and stats.plan is None:
+            self._explain(cur, stats, sql, parameters)
+        start = time.perf_counter()
+        res = cur.execute(sql, parameters)
+        stats.seconds += time.perf_counter() - start
+        return ProfiledCursor(res, stats)
+
+    def executemany(
+        self, cur: Union[sqlite3.Cursor, sqlite3.Connection], sql: str, parameters=()
+    ):
+        stats = self._statement(sql)
+        stats.calls += 1
+        stats.call_sites[self._call_site()] += 1
+        start = time.perf_counter()
+        res = cur.executemany(sql, parameters)
+        stats.seconds += time.perf_counter() - start
+        stats.rows += max(res.rowcount, 0)
+        return res
+
+    def ranked(self) -> list[StatementStats]:
+        """Returns statement statistics, most expensive first"""
+        return sorted(self.stats.values(), key=lambda s: s.seconds, reverse=True)
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            elapsed_seconds=time.time() - self.start_time,
+            sql_seconds=sum(s.seconds for s in self.stats.values()),
+            statements=[s.as_dict() for s in self.ranked()],
+        )
+
+    def write_json(self, filename: Union[str, os.PathLike]) -> None:
+        with open(filename, "w") as fp:
+            json.dump(self.as_dict(), fp, indent=2)
+
+    def print_report(self, file: IO[str] = sys.stderr, limit: int = 20) -> None:
+        """Prints the 'limit' most expensive statements as a table"""
+        displaywidth, _ = shutil.get_terminal_size((120, 24))
+        ranked = self.ranked()
+        total = sum(s.seconds for s in ranked)
+        print(f"sql profile: {len(ranked)} statements, {total:.2f}s total", file=file)
+        header = f"{'seconds':>9} {'calls':>7} {'rows':>9}  statement"
+        print(header, file=file)
+        width = max(displaywidth - len(header) + len("statement"), 40)
+        for s in ranked[:limit]:
+            sql = s.sql if len(s.sql) <= width else s.sql[: width - 3] + "..."
+            print(f"{s.seconds:9.3f} {s.calls:7d} {s.rows:9d}  {sql}", file=file)
+            site, _ = s.call_sites.most_common(1)[0]
+            print(f"{'':27}  at {site}", file=file)
+            for line in s.plan or []:
+                print(f"{'':27}  plan: {line}", file=file)
+
+
+def enable(explain: bool = False) -> QueryProfiler:
+    """Installs a new profiler for model.execute and returns it"""
+    model.profiler = QueryProfiler(explain=explain)
+    return model.profiler
+
+
+def disable() -> Optional[QueryProfiler]:
+    """Uninstalls the profiler and returns it, if any"""
+    profiler, model.profiler = model.profiler, None
+    return profiler
@@ -20,7 +20,7 @@ from typing import NamedTuple, Optional, Union
 import ctadl
 from ctadl.util.graph import BFS, AdjacencyGraph1, Search
 
-from .model import execute
+from .model import execute, tuple_cursor
 from .types import SliceDirection, VertexId
 
 logger = logging.getLogger(__name__)
@@ -408,7 +408,8 @@ class SemiNaiveMinPathLength:
             """,
             tuple(chain([n], [], [self.dir.value])),
         )
-        execute(cur, """PRAGMA optimize""")
+        # Only the TEMP tables change here, and the main schema may be read-only
+        execute(cur, """PRAGMA temp.optimize""")
         self.con.commit()
 
     def _count(self, n: int):
@@ -476,7 +477,7 @@ class SemiNaiveMinPathLength:
             n += 1
             if self._count(n):
                 break
-        cur = self.con.cursor()
+        cur = tuple_cursor(self.con)
         for row in execute(cur, """SELECT count(*) FROM fp"""):
             logger.debug("SemiNaive table has %d rows", row[0])
             break
@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ctadl.analysiscache import AnalysisCache, PreprocessedCache, tree_digest
+
+flags = dict(souffle="2.4", cxxflags="", parallel=True)
+
+
+class TestAnalysisCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = Path(self.tmpdir.name) / "index.dl"
+        self.src.write_text(".decl A(x: number)\n")
+        self.cache = AnalysisCache(Path(self.tmpdir.name) / "cache")
+        os.makedirs(self.cache.cachedir)
+        self.builds = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def build(self, out: Path):
+        self.builds += 1
+        time.sleep(0.05)
+        out.write_bytes(b"binary")
+
+    def test_key(self):
+        key = self.cache.key(self.src, flags)
+        self.assertEqual(key, self.cache.key(self.src, dict(flags)))
+        self.assertNotEqual(key, self.cache.key(self.src, {**flags, "souffle": "2.5"}))
+        self.src.write_text(".decl B(x: number)\n")
+        self.assertNotEqual(key, self.cache.key(self.src, flags))
+
+    def test_get_or_build(self):
+        key = self.cache.key(self.src, flags)
+        self.assertIsNone(self.cache.lookup(key))
+        bin = self.cache.get_or_build(key, flags, self.build)
+        self.assertEqual(bin.read_bytes(), b"binary")
+        self.assertEqual(self.cache.get_or_build(key, flags, self.build), bin)
+        self.assertEqual(self.builds, 1)
+        (entry,) = self.cache.entries()
+        self.assertEqual((entry.kind, entry.size, entry.flags), ("analysis", 6, flags))
+
+    def test_concurrent_builds_compile_once(self):
+        key = self.cache.key(self.src, flags)
+        threads = [
+            threading.Thread(
+                target=self.cache.get_or_build, args=(key, flags, self.build)
+            )
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.builds, 1)
+
+    def test_not_published_on_error(self):
+        key = self.cache.key(self.src, flags)
+
+        def fail(out: Path):
+            out.write_bytes(b"partial")
+            raise RuntimeError("compilation failed")
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_build(key, flags, fail)
+        self.assertIsNone(self.cache.lookup(key))
+        self.assertEqual([p.name for p in self.cache.cachedir.iterdir()], ["manifest"])
+
+    def test_gc_evicts_least_recently_used(self):
+        keys = []
+        for i in range(3):
+            self.src.write_text(f".decl A{i}(x: number)\n")
+            keys.append(self.cache.key(self.src, flags))
+            self.cache.get_or_build(keys[-1], flags, self.build)
+            time.sleep(0.01)
+        self.cache.lookup(keys[0])
+        removed = self.cache.gc(12)
+        self.assertEqual([e.key for e in removed], [keys[1]])
+        self.assertIsNone(self.cache.lookup(keys[1]))
+        self.assertIsNotNone(self.cache.lookup(keys[0]))
+        self.assertIsNotNone(self.cache.lookup(keys[2]))
+
+    def test_gc_tolerates_files_removed_concurrently(self):
+        (self.cache.cachedir / "preprocessed").mkdir()
+        racing = [
+            self.cache.cachedir / ".souffle-version.123",
+            self.cache.cachedir / "preprocessed" / "abc.dl.456.tmp",
+            self.cache.cachedir / "preprocessed" / "abc.dl",
+            self.cache.cachedir / ("0" * 64),
+        ]
+        for path in racing:
+            path.write_bytes(b"x")
+        stat = Path.stat
+
+        # Another run removes each file after we list it, before we stat it
+        def racing_stat(path, **kwargs):
+            if path in racing:
+                path.unlink(missing_ok=True)
+            return stat(path, **kwargs)
+
+        with mock.patch.object(Path, "stat", racing_stat):
+            self.assertEqual(self.cache.gc(0), [])
+
+    def test_gc_keeps_locks(self):
+        key = self.cache.key(self.src, flags)
+        self.cache.get_or_build(key, flags, self.build)
+        lock = self.cache.manifestdir / f"{key}.lock"
+        self.assertTrue(lock.exists())
+        self.assertEqual(len(self.cache.gc(0)), 1)
+        self.assertIsNone(self.cache.lookup(key))
+        # Runs waiting on the lock share it with the next run
+        self.assertTrue(lock.exists())
+
+
+class TestPreprocessedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tree = Path(self.tmpdir.name) / "souffle-logic"
+        os.makedirs(self.tree / "graph")
+        (self.tree / "index.dl").write_text('#include "graph/dataflow.dl"\n')
+        (self.tree / "graph" / "dataflow.dl").write_text(".decl A(x: number)\n")
+        self.dl = Path(self.tmpdir.name) / "custom.dl"
+        self.dl.write_text(".decl B(x: number)\n")
+        self.cache = PreprocessedCache(Path(self.tmpdir.name) / "cache")
+        self.command = ["mcpp", "-P", str(self.tree / "index.dl"), "-DCTADL_STAR"]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def key(self):
+        tree_digest.cache_clear()
+        return self.cache.key(self.tree, self.command, self.dl)
+
+    def test_key(self):
+        key = self.key()
+        self.assertEqual(key, self.key())
+        self.assertNotEqual(key, self.cache.key(self.tree, self.command))
+        self.assertNotEqual(key, self.cache.key(self.tree, self.command[:-1], self.dl))
+        (self.tree / "graph" / "dataflow.dl").write_text(".decl A(x: symbol)\n")
+        self.assertNotEqual(key, self.key())
+        self.dl.write_text("")
+        self.assertNotEqual(key, self.key())
+
+    def test_store_and_load(self):
+        key = self.key()
+        out = Path(self.tmpdir.name) / "index.dl"
+        self.assertFalse(self.cache.load(key, out))
+        out.write_text("preprocessed")
+        self.cache.store(key, out)
+        out.unlink()
+        self.assertTrue(self.cache.load(key, out))
+        self.assertEqual(out.read_text(), "preprocessed")
+
+    def test_load_tolerates_gc(self):
+        key = self.key()
+        out = Path(self.tmpdir.name) / "index.dl"
+        out.write_text("preprocessed")
+        self.cache.store(key, out)
+        copyfile = shutil.copyfile
+
+        # 'ctadl cache gc' removes the entry after we copy it
+        def racing_copyfile(src, dst):
+            copyfile(src, dst)
+            os.unlink(src)
+
+        with mock.patch.object(shutil, "copyfile", racing_copyfile):
+            self.assertTrue(self.cache.load(key, out))
+        self.assertEqual(out.read_text(), "preprocessed")
+
+
+if __name__ == "__main__":
+    unittest.main()
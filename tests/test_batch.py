@@ -0,0 +1,94 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctadl.batch import BatchItem, Schedule, read_manifest, workload_jobs
+from ctadl.engine import default_threshold_bytes
+
+
+def item(name: str, jobs: int, memory_gib: float, workload: float) -> BatchItem:
+    return BatchItem(
+        name, Path(name), jobs=jobs, memory_gib=memory_gib, workload=workload
+    )
+
+
+class TestBatch(unittest.TestCase):
+    def test_read_manifest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "manifest.json"
+            path.write_text(
+                json.dumps(
+                    {
+                        "suts": [
+                            {"import": "a"},
+                            {"import": "b", "output": "out/b.db", "flags": ["--star"]},
+                        ]
+                    }
+                )
+            )
+            a, b = read_manifest(path)
+            self.assertEqual(
+                (a.name, a.importdir, a.output), ("a", path.parent / "a", None)
+            )
+            self.assertEqual(
+                (b.output, b.flags), (path.parent / "out/b.db", ["--star"])
+            )
+            for doc in [[], {"suts": [{"import": "a"}, {"import": "a"}]}]:
+                path.write_text(json.dumps(doc))
+                with self.assertRaises(ValueError):
+                    read_manifest(path)
+
+    def test_read_manifest_rejects_shared_directory(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "manifest.json"
+            (path.parent / "a").mkdir()
+            (path.parent / "b").mkdir()
+            (path.parent / "app1.apk").touch()
+            (path.parent / "app2.apk").touch()
+            for suts in [
+                [
+                    {"import": "a", "name": "a"},
+                    {"import": "a", "name": "a-star", "flags": ["--star"]},
+                ],
+                [{"import": "a"}, {"import": "../" + path.parent.name + "/a/"}],
+                # Import files run in their parent directory
+                [{"import": "app1.apk"}, {"import": "app2.apk"}],
+            ]:
+                path.write_text(json.dumps({"suts": suts}))
+                with self.assertRaises(ValueError):
+                    read_manifest(path)
+            path.write_text(json.dumps({"suts": [{"import": "a"}, {"import": "b"}]}))
+            self.assertEqual(len(read_manifest(path)), 2)
+
+    def test_workload_jobs(self):
+        self.assertEqual(workload_jobs(default_threshold_bytes, 16), 1)
+        self.assertEqual(workload_jobs(3 * default_threshold_bytes, 16), 2)
+        self.assertEqual(workload_jobs(8 * default_threshold_bytes, 16), 8)
+        self.assertEqual(workload_jobs(1000 * default_threshold_bytes, 16), 16)
+
+    def test_schedule_packs_small_around_large(self):
+        large = item("large", 6, 24, 100)
+        small = [item(f"small{i}", 1, 4, i) for i in range(4)]
+        schedule = Schedule(small + [large], cpus=8, memory_gib=32)
+        started = []
+        while (started_item := schedule.next()) is not None:
+            started.append(started_item.name)
+        # Memory, not CPUs, limits the small ones to two
+        self.assertEqual(started, ["large", "small3", "small2"])
+        schedule.finish(large)
+        self.assertEqual(schedule.next().name, "small1")
+
+    def test_schedule_runs_oversized_alone(self):
+        huge = item("huge", 32, 64, 100)
+        small = item("small", 1, 1, 1)
+        schedule = Schedule([small, huge], cpus=8, memory_gib=32)
+        self.assertEqual(schedule.next().name, "small")
+        self.assertIsNone(schedule.next())
+        schedule.finish(small)
+        self.assertEqual(schedule.next().name, "huge")
+        self.assertIsNone(schedule.next())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import math
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctadl.engine import (
+    EngineRuns,
+    choose_engine,
+    default_threshold_bytes,
+    estimate_workload,
+)
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.runs = EngineRuns(Path(self.tmpdir.name) / "engine-runs.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_estimate_workload(self):
+        self.assertEqual(estimate_workload(100), 100)
+        self.assertEqual(estimate_workload(100, star=True, cha=True), 800)
+
+    def test_default_threshold(self):
+        self.assertEqual(self.runs.threshold("index", [60.0]), default_threshold_bytes)
+        self.runs.record("index", "interpreted", 1000, 10.0)
+        self.assertEqual(self.runs.threshold("index", [60.0]), default_threshold_bytes)
+
+    def test_fitted_threshold(self):
+        # Interpreting takes 10ms per unit, compiled runs 2ms, compiling 80s
+        self.runs.record("index", "interpreted", 1000, 10.0)
+        self.runs.record("index", "compiled", 5000, 10.0)
+        self.runs.record("query", "compiled", 1, 1000.0)
+        threshold = self.runs.threshold("index", [80.0])
+        self.assertAlmostEqual(threshold, 10000)
+        self.assertEqual(choose_engine(9000, threshold), "interpreted")
+        self.assertEqual(choose_engine(11000, threshold), "compiled")
+
+    def test_interpreter_never_slower(self):
+        self.runs.record("query", "interpreted", 1000, 1.0)
+        self.runs.record("query", "compiled", 1000, 2.0)
+        self.assertEqual(self.runs.threshold("query", [80.0]), math.inf)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+import csv
+import gzip
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctadl import SouffleDialect
+from ctadl.vis.model import (
+    DB,
+    ColumnSpec,
+    CTADLConfig,
+    Facts,
+    SymbolCache,
+    close_readonly_dbs,
+    missing_indexes,
+    readonly_db,
+    require_indexes,
+    tuple_cursor,
+)
+from ctadl.vis.types import CtadlModelError
+
+
+class TestSqliteFacts(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "ctadlir.db"
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                'CREATE TABLE "__SymbolTable" (id INTEGER PRIMARY KEY, symbol TEXT UNIQUE)'
+            )
+        self.facts = Facts(self.db_path)
+        self.facts.add_input_relation(
+            "MG_Test",
+            [
+                ColumnSpec("nodeid", "TEXT NOT NULL"),
+                ColumnSpec("name", "TEXT NOT NULL"),
+                ColumnSpec("index", "INTEGER NOT NULL"),
+            ],
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def rows(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return sorted(conn.execute('SELECT * FROM "MG_Test"').fetchall())
+
+    def test_write_rows(self):
+        with self.facts.writer() as w:
+            self.facts.write(w, "MG_Test", "1", "foo", 0)
+            self.facts.write(w, "MG_Test", "2", "foo", 1)
+            self.facts.write(w, "MG_Test", "2", "foo", 1)
+        self.assertEqual(self.rows(), [("1", "foo", 0), ("2", "foo", 1)])
+
+    def test_read(self):
+        with self.facts.writer() as w:
+            self.facts.write(w, "MG_Test", "1", "foo", 0)
+        rows = self.facts.read("MG_Test")
+        assert rows is not None
+        self.assertEqual(list(rows), [("1", "foo", 0)])
+        self.assertIsNone(self.facts.read("MG_Missing"))
+        close_readonly_dbs()
+
+    def test_write_quoted_symbols(self):
+        with self.facts.writer() as w:
+            self.facts.write(w, "MG_Test", "1", "it's", 0)
+            self.facts.write(w, "MG_Test", "2", "\"a\" OR symbol = 'b'", 1)
+        self.assertEqual(
+            self.rows(), [("1", "it's", 0), ("2", "\"a\" OR symbol = 'b'", 1)]
+        )
+
+    def test_symbols_shared_with_existing_table(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('INSERT INTO "__SymbolTable" (symbol) VALUES (?)', ("foo",))
+        with self.facts.writer() as w:
+            self.facts.write(w, "MG_Test", "1", "foo", 0)
+        with sqlite3.connect(self.db_path) as conn:
+            (n,) = conn.execute(
+                'SELECT count(*) FROM "__SymbolTable" WHERE symbol = ?', ("foo",)
+            ).fetchone()
+        self.assertEqual(n, 1)
+        self.assertEqual(self.rows(), [("1", "foo", 0)])
+
+
+class TestFactsDir(unittest.TestCase):
+    rows = [("1", "foo", "0"), ("2", 'tab\there "quoted"\nnewline', "1")]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, compress):
+        facts = Facts(self.path, compress=compress)
+        facts.add_input_relation("MG_Test", [])
+        with facts.writer() as w:
+            for row in self.rows:
+                facts.write(w, "MG_Test", *row)
+        return w
+
+    def test_write_escaped(self):
+        w = self.write(compress=False)
+        with open(self.path / "MG_Test.facts", newline="") as fp:
+            self.assertEqual(
+                [tuple(r) for r in csv.reader(fp, dialect=SouffleDialect)], self.rows
+            )
+        self.assertEqual(
+            w.bytes_written["MG_Test"], (self.path / "MG_Test.facts").stat().st_size
+        )
+
+    def test_write_compressed(self):
+        w = self.write(compress=True)
+        with gzip.open(self.path / "MG_Test.facts", "rt", newline="") as fp:
+            self.assertEqual(
+                [tuple(r) for r in csv.reader(fp, dialect=SouffleDialect)], self.rows
+            )
+        self.assertGreater(w.bytes_written["MG_Test"], 0)
+
+    def test_read(self):
+        for compress in [False, True]:
+            (self.path / "MG_Test.facts").unlink(missing_ok=True)
+            self.write(compress=compress)
+            rows = Facts(self.path).read("MG_Test")
+            assert rows is not None
+            self.assertEqual(list(rows), self.rows)
+        self.assertIsNone(Facts(self.path).read("MG_Missing"))
+
+
+class TestSymbolCache(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute(
+            'CREATE TABLE "__SymbolTable" (id INTEGER PRIMARY KEY, symbol TEXT UNIQUE)'
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_intern_and_lookup(self):
+        cache = SymbolCache(self.conn)
+        ids = cache.intern(["a", "b", "a"])
+        self.assertEqual(set(ids), {"a", "b"})
+        self.assertEqual(cache.id("a"), ids["a"])
+        self.assertEqual(cache.symbol(ids["b"]), "b")
+        self.assertEqual(SymbolCache(self.conn).intern(["a"]), {"a": ids["a"]})
+
+    def test_missing_symbol(self):
+        cache = SymbolCache(self.conn)
+        self.assertEqual(cache.prefetch(["nope"]), {})
+        with self.assertRaises(CtadlModelError):
+            cache.id("nope")
+
+    def test_lru_bound(self):
+        cache = SymbolCache(self.conn, maxsize=2)
+        symbols = [f"s{i}" for i in range(1000)]
+        ids = cache.intern(symbols)
+        self.assertEqual(len(ids), 1000)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.id("s0"), ids["s0"])
+
+
+class TestCTADLConfig(unittest.TestCase):
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "ctadlir.db"
+            facts = Facts(path)
+            with sqlite3.connect(path) as conn:
+                conn.execute(
+                    'CREATE TABLE "__SymbolTable" (id INTEGER PRIMARY KEY, symbol TEXT UNIQUE)'
+                )
+            facts.add_input_relation(
+                "CTADLConfig",
+                [
+                    ColumnSpec("feature", "TEXT NOT NULL"),
+                    ColumnSpec("value", "TEXT NOT NULL"),
+                ],
+            )
+            with DB(path) as conn:
+                config = CTADLConfig(conn)
+                config.update([("a", "1"), ("b", "2")])
+                config["a"] = "3"
+                config.update([("b", "4"), ("b", "5")])
+                self.assertEqual(config["a"], "3")
+                self.assertEqual(config["b"], "5")
+                self.assertNotIn("c", config)
+
+
+class TestReadOnlyDB(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "ctadlir.db"
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('CREATE TABLE "T" (x INTEGER)')
+            conn.execute('INSERT INTO "T" VALUES (1)')
+
+    def tearDown(self):
+        close_readonly_dbs()
+        self.tmpdir.cleanup()
+
+    def test_readonly(self):
+        with DB(self.db_path, readonly=True) as conn:
+            self.assertEqual(conn.execute('SELECT x FROM "T"').fetchone()["x"], 1)
+            conn.execute('CREATE TEMP TABLE "scratch" (x INTEGER)')
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute('INSERT INTO "T" VALUES (2)')
+
+    def test_shared_connection(self):
+        conn = readonly_db(self.db_path)
+        self.assertIs(conn, readonly_db(str(self.db_path)))
+        self.assertEqual(
+            tuple_cursor(conn).execute('SELECT x FROM "T"').fetchall(), [(1,)]
+        )
+
+
+class TestRequireIndexes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "ctadlir.db"
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('CREATE TABLE "_TaintSourceVertex" ("0", "1", "2")')
+
+    def tearDown(self):
+        close_readonly_dbs()
+        self.tmpdir.cleanup()
+
+    def built(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute('SELECT name, consumer FROM "CTADLIndex"').fetchall()
+
+    def test_builds_missing_indexes_once(self):
+        with DB(self.db_path) as conn:
+            self.assertEqual(len(missing_indexes(conn, "sarifpaths")), 2)
+            require_indexes(conn, "sarifpaths")
+            self.assertEqual(missing_indexes(conn, "sarifpaths"), [])
+            require_indexes(conn, "summary")
+        self.assertEqual(
+            sorted(self.built()),
+            [
+                ("idx__TaintSourceVertex_0", "sarifpaths"),
+                ("idx__TaintSourceVertex_1_2", "sarifpaths"),
+            ],
+        )
+
+    def test_readonly_connection(self):
+        conn = readonly_db(self.db_path)
+        require_indexes(conn, "sarifpaths")
+        self.assertEqual(missing_indexes(conn, "sarifpaths"), [])
+        self.assertEqual(len(self.built()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
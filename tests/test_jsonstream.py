@@ -0,0 +1,75 @@
+import io
+import json
+import unittest
+
+from ctadl.util.jsonstream import ObjectArrayStream, dump_object_array
+
+
+def stream(doc: str, key="model_generators", chunk_size=3) -> ObjectArrayStream:
+    s = ObjectArrayStream(io.BytesIO(doc.encode()), key)
+    s.chunk_size = chunk_size
+    return s
+
+
+class TestObjectArrayStream(unittest.TestCase):
+    def test_elements_and_other_keys(self):
+        doc = {
+            "datalog": ["a.dl"],
+            "model_generators": [{"find": "methods"}, 12345, 'é"', [1, [2]], None],
+            "after": 1.5,
+        }
+        s = stream(json.dumps(doc, indent=2))
+        self.assertEqual(list(s), doc["model_generators"])
+        self.assertEqual(s.other, {"datalog": ["a.dl"], "after": 1.5})
+        self.assertEqual(s.bytes_read, len(json.dumps(doc, indent=2).encode()))
+
+    def test_empty(self):
+        self.assertEqual(list(stream("{}")), [])
+        self.assertEqual(list(stream('{"model_generators": [ ]}')), [])
+
+    def test_not_an_object(self):
+        s = stream("[1, 2]")
+        self.assertFalse(s.is_object())
+        with self.assertRaises(ValueError):
+            list(s)
+
+    def test_malformed(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(stream('{"model_generators": [1, 2'))
+        with self.assertRaises(json.JSONDecodeError):
+            list(stream('{"model_generators": [1 2]}'))
+
+    def test_large_value_reads_grow(self):
+        element = {"where": ["x" * 10 for _ in range(1000)]}
+        doc = json.dumps({"model_generators": [element, 1]})
+        s = stream(doc, chunk_size=16)
+        reads = []
+        read = s.fp.read
+        s.fp.read = lambda size: reads.append(size) or read(size)
+        self.assertEqual(list(s), [element, 1])
+        # Doubling, rather than one chunk at a time, so the element isn't
+        # decoded from its start a thousand times
+        self.assertLess(len(reads), 20)
+
+
+class TestDumpObjectArray(unittest.TestCase):
+    elements = [{"find": "methods", "where": [{"a": 1}]}, 2, "x"]
+
+    def test_like_json_dump(self):
+        for elements in [[], self.elements]:
+            for indent in [None, 2]:
+                fp = io.StringIO()
+                n = dump_object_array(fp, "mg", iter(elements), indent=indent)
+                self.assertEqual(n, len(elements))
+                expected = json.dumps({"mg": elements}, indent=indent) + "\n"
+                self.assertEqual(fp.getvalue(), expected)
+
+    def test_lines(self):
+        fp = io.StringIO()
+        dump_object_array(fp, "mg", iter(self.elements), indent=2, lines=True)
+        lines = fp.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.elements)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import signal
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from ctadl.memorylimit import MemoryLimit
+
+
+@mock.patch.object(MemoryLimit, "uses_cgroup", False)
+class TestMemoryLimit(unittest.TestCase):
+    def setUp(self):
+        self.limit = MemoryLimit(256 * 2**20)
+
+    def run_python(self, code: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            self.limit.command([sys.executable, "-c", code]),
+            preexec_fn=self.limit.preexec,
+            capture_output=True,
+        )
+
+    def test_rlimit(self):
+        res = self.run_python("x = bytearray(512 * 2**20)")
+        self.assertNotEqual(res.returncode, 0)
+        self.assertIn(b"MemoryError", res.stderr)
+        res = self.run_python("x = bytearray(64 * 2**20)")
+        self.assertEqual(res.returncode, 0)
+
+    def test_exceeded(self):
+        self.assertFalse(self.limit.exceeded(256 * 2**20))
+        self.assertTrue(self.limit.exceeded(256 * 2**20 + 1))
+
+    def test_is_out_of_memory(self):
+        self.assertTrue(self.limit.is_out_of_memory(-signal.SIGKILL, b""))
+        self.assertTrue(self.limit.is_out_of_memory(-signal.SIGABRT, None))
+        self.assertTrue(
+            self.limit.is_out_of_memory(
+                -signal.SIGABRT,
+                b"terminate called after throwing an instance of 'std::bad_alloc'",
+            )
+        )
+        self.assertFalse(self.limit.is_out_of_memory(-signal.SIGABRT, b"assertion"))
+        self.assertFalse(self.limit.is_out_of_memory(1, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ctadl.modelcache import ModelFactsCache
+
+
+class ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, name, *cols):
+        self.rows.append((name, *cols))
+
+
+rows = [("MG_Name", 1, "foo"), ("MG_Edge1", 2, 1), ("MG_Op", 2, "NOT")]
+
+
+class TestModelFactsCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.models = Path(self.tmpdir.name) / "models.json"
+        self.models.write_text('{"model_generators": []}')
+        self.cache = ModelFactsCache(Path(self.tmpdir.name) / "cache")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        key = self.cache.key(self.models, first_id=1, validated=True)
+        self.assertEqual(key, self.cache.key(self.models, first_id=1, validated=True))
+        self.assertNotEqual(
+            key, self.cache.key(self.models, first_id=2, validated=True)
+        )
+        self.assertNotEqual(
+            key, self.cache.key(self.models, first_id=1, validated=False)
+        )
+        self.models.write_text('{"model_generators": [ ]}')
+        self.assertNotEqual(
+            key, self.cache.key(self.models, first_id=1, validated=True)
+        )
+
+    def test_record_and_load(self):
+        key = self.cache.key(self.models, first_id=1, validated=True)
+        self.assertIsNone(self.cache.load(key, ListWriter()))
+        inner = ListWriter()
+        with self.cache.recorder(key, inner) as w:
+            for row in rows:
+                w.write(*row)
+            w.next_id = 3
+        self.assertEqual(inner.rows, rows)
+        cached = ListWriter()
+        self.assertEqual(self.cache.load(key, cached), 3)
+        self.assertEqual(cached.rows, rows)
+
+    def test_not_published_on_error(self):
+        key = self.cache.key(self.models, first_id=1, validated=True)
+        with self.assertRaises(ValueError):
+            with self.cache.recorder(key, ListWriter()) as w:
+                w.write(*rows[0])
+                raise ValueError("invalid models")
+        self.assertIsNone(self.cache.load(key, ListWriter()))
+        self.assertEqual(list(self.cache.cachedir.iterdir()), [])
+
+    def test_load_tolerates_gc(self):
+        key = self.cache.key(self.models, first_id=1, validated=True)
+        with self.cache.recorder(key, ListWriter()) as w:
+            w.write(*rows[0])
+            w.next_id = 2
+        # 'ctadl cache gc' removes the entry after we read it
+        with mock.patch("os.utime", side_effect=FileNotFoundError):
+            self.assertEqual(self.cache.load(key, ListWriter()), 2)
+
+    def test_unreadable_entry_is_removed(self):
+        key = self.cache.key(self.models, first_id=1, validated=True)
+        with self.cache.recorder(key, ListWriter()) as w:
+            for row in rows:
+                w.write(*row)
+            w.next_id = 3
+        entry = self.cache.path(key).read_bytes()
+        lines = gzip.decompress(entry).splitlines(keepends=True)
+        for bad in [
+            entry[: len(entry) // 2],
+            b"not gzip",
+            gzip.compress(b"".join(lines[:-1])),
+            gzip.compress(b"".join(lines[:1] + [b'["MG_Edge1", 2\n'] + lines[2:])),
+        ]:
+            self.cache.path(key).write_bytes(bad)
+            writer = ListWriter()
+            self.assertIsNone(self.cache.load(key, writer))
+            self.assertEqual(writer.rows, [])
+            self.assertFalse(self.cache.path(key).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
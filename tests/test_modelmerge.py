@@ -0,0 +1,77 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+try:
+    from ctadl.modelmerge import ModelMerger, generator_key
+except ImportError:
+    ModelMerger = None
+
+
+def summary(func, *props):
+    return {
+        "find": "methods",
+        "where": [
+            {"constraint": "signature_match", "name": "f", "unqualified-id": func}
+        ],
+        "model": {"propagation": [{"input": i, "output": "Return"} for i in props]},
+    }
+
+
+@unittest.skipIf(ModelMerger is None, "json5 not installed")
+class TestModelMerger(unittest.TestCase):
+    def test_key_normalized(self):
+        a = {
+            "find": "methods",
+            "where": [
+                {"constraint": "name", "pattern": "x"},
+                {"constraint": "signature_match", "names": ["b", "a"]},
+            ],
+        }
+        b = {
+            "find": "methods",
+            "where": [
+                {"constraint": "signature_match", "names": ["a", "b"]},
+                {"constraint": "name", "pattern": "x"},
+            ],
+        }
+        self.assertEqual(generator_key(a), generator_key(b))
+        self.assertNotEqual(generator_key(a), generator_key(dict(a, find="fields")))
+
+    def test_merge_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = Path(tmpdir) / "first.json"
+            first.write_text(
+                json.dumps(
+                    {
+                        "datalog": ["a.dl"],
+                        "model_generators": [
+                            summary("F", "Argument(0)"),
+                            summary("G", "Argument(0)"),
+                        ],
+                    }
+                )
+            )
+            second = Path(tmpdir) / "second.jsonl"
+            second.write_text(
+                json.dumps(summary("F", "Argument(0)", "Argument(1)")) + "\n"
+            )
+            merger = ModelMerger()
+            merger.add_file(first)
+            merger.add_file(second)
+        fp = io.StringIO()
+        self.assertEqual(merger.write(fp), 2)
+        self.assertNotIn(" ", fp.getvalue())
+        merged = json.loads(fp.getvalue())
+        self.assertEqual(merged["datalog"], ["a.dl"])
+        self.assertEqual(
+            merged["model_generators"],
+            [summary("F", "Argument(0)", "Argument(1)"), summary("G", "Argument(0)")],
+        )
+        self.assertEqual(merger.num_read, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctadl.vis.model import Facts
+
+try:
+    from ctadl.models import JSONTranslator, ProgramNames
+except ImportError:
+    JSONTranslator = None
+    ProgramNames = None
+
+where = [
+    {"constraint": "parent", "inner": {"constraint": "name", "pattern": "Lfoo;"}},
+    {"constraint": "name", "pattern": "bar"},
+]
+
+
+def generator(kind, where=where):
+    return {
+        "find": "methods",
+        "where": where,
+        "model": {"sources": [{"kind": kind, "port": "Return"}]},
+    }
+
+
+@unittest.skipIf(JSONTranslator is None, "json5 not installed")
+class TestJSONTranslator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.factsdir = Path(self.tmpdir.name) / "facts"
+        os.makedirs(self.factsdir)
+        self.translator = JSONTranslator(Facts(self.factsdir))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def translate(self, generators):
+        models = Path(self.tmpdir.name) / "models.json"
+        models.write_text(json.dumps({"model_generators": generators}))
+        self.translator.translate(models, progress=False, cache=False)
+
+    def rows(self, relation):
+        with open(self.factsdir / f"{relation}.facts") as fp:
+            return [line.rstrip("\n").split("\t") for line in fp]
+
+    def test_constraints_shared(self):
+        self.translate([generator("A"), generator("B"), generator("C", where[:1])])
+        self.assertEqual(len(self.rows("MG_Name")), 2)
+        self.assertEqual(len(self.rows("MG_Parent")), 1)
+        self.assertEqual(self.translator.interned_hits, 6)
+        self.assertEqual(self.translator.interned_misses, 4)
+
+    def test_roots_not_shared(self):
+        self.translate([generator("A"), generator("B")])
+        roots = [row[0] for row in self.rows("MG_Endpoint")]
+        self.assertEqual(len(set(roots)), 2)
+
+    def test_wide_union_flat(self):
+        names = [f"m{i}" for i in range(100)]
+        self.translate(
+            [
+                {
+                    "find": "methods",
+                    "where": [{"constraint": "signature_match", "names": names}],
+                    "model": {},
+                }
+            ]
+        )
+        self.assertEqual(len(self.rows("MG_AnyOf")), 1)
+        self.assertEqual(len(self.rows("MG_EdgeN")), 100)
+        self.assertEqual(
+            sorted(int(row[1]) for row in self.rows("MG_EdgeN")), list(range(100))
+        )
+
+    def test_prefilter(self):
+        (self.factsdir / "CFunction_Name.facts").write_text("f1\tfoo\n")
+        (self.factsdir / "CNamespace_Parent.facts").write_text("f1\tLfoo;\n")
+        translator = JSONTranslator(Facts(self.factsdir))
+        self.translator = translator
+
+        def sig(**kwargs):
+            con = dict(constraint="signature_match", **kwargs)
+            return {"find": "methods", "where": [con], "model": {}}
+
+        generators = [
+            sig(name="foo", parent="Lfoo;"),
+            sig(names=["bar", "foo"]),
+            sig(name="baz"),
+            sig(parents=["Lbar;"]),
+            {
+                "find": "methods",
+                "where": [
+                    {"constraint": "any_of", "inners": [sig(name="qux")["where"][0]]}
+                ],
+            },
+            {"find": "variables", "where": sig(name="bar")["where"]},
+        ]
+        program = translator.program_names
+        assert program is not None
+        self.assertEqual(
+            [program.may_match(gen) for gen in generators],
+            [True, True, False, False, False, True],
+        )
+        self.translate(generators)
+        names = sorted(row[1] for row in self.rows("MG_SigMatchName"))
+        self.assertEqual(names, ["bar", "foo"])
+        parents = [row[1] for row in self.rows("MG_SigMatchParent")]
+        self.assertEqual(parents, ["Lfoo;"])
+
+    def test_program_names_unquoted(self):
+        # Importers don't quote fields, so a name may start with a quote
+        (self.factsdir / "CFunction_Name.facts").write_text('f1\t"foo\nf2\tbar"\n')
+        (self.factsdir / "CNamespace_Parent.facts").write_text("f1\tLfoo;\n")
+        program = ProgramNames.load(Facts(self.factsdir))
+        assert program is not None
+        self.assertEqual(program.names, {'"foo', 'bar"'})
+        self.assertEqual(program.parents, {"Lfoo;"})
+
+    def test_iter_propagation_models(self):
+        conn = sqlite3.connect(":memory:")
+        conn.executescript("""
+            CREATE TABLE SummaryFlow (m1, n1, p1, m2, n2, p2, ctx);
+            CREATE TABLE CFunction_Name (function, name);
+            CREATE TABLE CFunction_Signature (function, signature);
+            CREATE TABLE CNamespace_Parent (child, parent);
+            INSERT INTO SummaryFlow VALUES
+                ('f', -1, '', 'f', 0, '.x', ''),
+                ('f', 1, '', 'f', 0, '', ''),
+                ('g', -1, '', 'g', 0, '', 'ctx'),
+                ('h', -1, '', 'h', 0, '', '');
+            -- A function's summaries aren't repeated for each of its names
+            INSERT INTO CFunction_Name VALUES ('f', 'foo'), ('f', 'foo2'), ('h', 'bar');
+            INSERT INTO CFunction_Signature VALUES ('f', 'foo()'), ('h', 'bar()');
+            INSERT INTO CNamespace_Parent VALUES ('f', 'Lfoo;');
+            """)
+        # As read-only indexes have it
+        conn.execute("PRAGMA temp_store = MEMORY")
+        generators = list(JSONTranslator.iter_propagation_models(conn))
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone(), (2,))
+        self.assertEqual(
+            [gen["where"][0] for gen in generators],
+            [
+                {
+                    "constraint": "signature_match",
+                    "name": "foo",
+                    "parent": "Lfoo;",
+                    "unqualified-id": "f",
+                },
+                {"constraint": "signature_match", "name": "bar", "unqualified-id": "h"},
+            ],
+        )
+        self.assertEqual(
+            generators[0]["model"]["propagation"],
+            [
+                {"input": "Argument(0).x", "output": "Return"},
+                {"input": "Argument(0)", "output": "Argument(1)"},
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctadl import modelschema
+from ctadl.modelschema import ModelValidationError, ParallelValidator
+
+valid = {"find": "methods", "where": [{"constraint": "name", "pattern": "foo"}]}
+invalid = {"find": "nothing"}
+
+
+def requires(module):
+    try:
+        __import__(module)
+        return lambda f: f
+    except ImportError:
+        return unittest.skip(f"{module} not installed")
+
+
+class TestModelSchema(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cachedir = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_error_location(self, validator):
+        validator.validate_generators([valid, valid], start=10)
+        with self.assertRaises(ModelValidationError) as cm:
+            validator.validate_generators([valid, invalid], start=10)
+        self.assertEqual(cm.exception.path, ["model_generators", 11, "find"])
+        self.assertTrue(str(cm.exception).startswith("model_generators[11].find: "))
+
+    @requires("fastjsonschema")
+    def test_fastjsonschema_cached(self):
+        validator = modelschema.load_validator(self.cachedir)
+        self.assertEqual(validator.backend, "fastjsonschema")
+        self.assertEqual(len(list(self.cachedir.glob("model_schema_*.py"))), 1)
+        self.check_error_location(validator)
+
+    @requires("jsonschema")
+    def test_jsonschema(self):
+        validate = modelschema._jsonschema_validator(modelschema.schema_bytes())
+        self.check_error_location(modelschema.Validator(validate, "jsonschema"))
+
+    @requires("fastjsonschema")
+    def test_parallel(self):
+        chunks = [(0, [valid, valid]), (2, [valid]), (3, [valid, invalid])]
+        with ParallelValidator(2, self.cachedir) as pv:
+            self.assertEqual(list(pv.validate(chunks[:2])), chunks[:2])
+            with self.assertRaises(ModelValidationError) as cm:
+                list(pv.validate(chunks))
+        self.assertEqual(cm.exception.path, ["model_generators", 4, "find"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import contextlib
+import importlib.machinery
+import importlib.util
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+cli_path = Path(__file__).parent.parent / "bin" / "ctadl"
+
+
+def load_cli():
+    loader = importlib.machinery.SourceFileLoader("ctadl_cli", str(cli_path))
+    spec = importlib.util.spec_from_loader("ctadl_cli", loader)
+    assert spec is not None
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+try:
+    cli = load_cli()
+except ImportError as e:
+    cli = None
+    skip_reason = f"cannot load bin/ctadl: {e}"
+else:
+    skip_reason = ""
+
+
+@unittest.skipIf(cli is None, skip_reason)
+class TestQueryBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmpdir.name)
+        for name in ["a.json", "b.json"]:
+            (self.dir / name).write_text("{}")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def parse(self, argv: list[str]):
+        return cli.make_argparser().parse_args(argv)
+
+    def assert_rejected(self, argv: list[str]):
+        args = self.parse(argv)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+            io.StringIO()
+        ):
+            with self.assertRaises(SystemExit) as cm:
+                cli.handle_query_batch(args)
+        self.assertEqual(cm.exception.code, 1)
+
+    def test_query_batch_args_round_trip(self):
+        args = self.parse(
+            ["query", "--batch", str(self.dir / "a.json")]
+            + ["--format", "sarif", "--compute-slices", "all"]
+            + ["--path-avoid-strategy", "none", "--engine", "interpreted"]
+            + ["-M", "X=1", "--souffle-arg=--magic-transform=*"]
+            + ["--preprocessor-arg=-DY", "--all-outputs"]
+            + ["--skip-model-validation", "--no-model-cache", "-v", "-v"]
+        )
+        query = self.dir / "a.json"
+        output = self.dir / "out" / "a.sarif"
+        child = self.parse(cli.query_batch_args(args, query, 3, output))
+        self.assertEqual(child.query, query.resolve())
+        self.assertIsNone(child.batch)
+        self.assertEqual(child.jobs, 3)
+        self.assertEqual(child.output, str(output))
+        for name in [
+            "format",
+            "compute_slices",
+            "path_avoid_strategy",
+            "engine",
+            "macro",
+            "souffle_arg",
+            "preprocessor_arg",
+            "all_outputs",
+            "validate_models",
+            "model_cache",
+            "profile",
+            "skip_analysis",
+            "verbose",
+        ]:
+            self.assertEqual(getattr(child, name), getattr(args, name), name)
+
+    def test_rejects_query_and_batch(self):
+        a = str(self.dir / "a.json")
+        self.assert_rejected(["query", a, "--batch", str(self.dir / "b.json")])
+
+    def test_rejects_duplicate_stems(self):
+        (self.dir / "sub").mkdir()
+        (self.dir / "sub" / "a.json").write_text("{}")
+        self.assert_rejected(
+            ["query", "--batch", str(self.dir / "a.json"), str(self.dir / "sub/a.json")]
+        )
+
+    def test_rejects_missing_query(self):
+        self.assert_rejected(["query", "--batch", str(self.dir / "missing.json")])
+
+    def test_outdir(self):
+        a = str(self.dir / "a.json")
+        args = self.parse(["query", "--batch", a])
+        self.assertEqual(cli.query_batch_outdir(args), Path("query-batch"))
+        args = self.parse(["query", "--batch", a, "-o", "-"])
+        self.assertEqual(cli.query_batch_outdir(args), Path("query-batch"))
+        args = self.parse(["query", "--batch", a, "-o", str(self.dir / "results")])
+        self.assertEqual(cli.query_batch_outdir(args), self.dir / "results")
+
+
+if __name__ == "__main__":
+    unittest.main()
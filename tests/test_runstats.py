@@ -0,0 +1,69 @@
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from ctadl.vis import runstats
+
+
+def run(recorder: runstats.RunStats, code: str) -> runstats.ProcessStats:
+    process = subprocess.Popen([sys.executable, "-c", code])
+    stats = recorder.begin("python", process.args, process.pid)
+    while True:
+        try:
+            rusage = runstats.wait(process, timeout=0.1)
+            break
+        except subprocess.TimeoutExpired:
+            stats.sample()
+    stats.finish(process.returncode, rusage)
+    return stats
+
+
+class TestRunStats(unittest.TestCase):
+    def setUp(self):
+        self.recorder = runstats.RunStats()
+
+    def test_samples_and_totals(self):
+        stats = run(
+            self.recorder,
+            "import time; x = bytearray(64 * 2**20); time.sleep(0.5); exit(3)",
+        )
+        self.assertEqual(stats.returncode, 3)
+        self.assertGreater(stats.seconds, 0.4)
+        self.assertGreater(stats.peak_rss, 64 * 2**20)
+        self.assertGreater(stats.cpu_seconds, 0)
+        self.assertTrue(stats.samples)
+        self.assertGreaterEqual(stats.peak_threads, 1)
+
+    def test_measure(self):
+        with self.recorder.measure("plugin", ["plugin"]) as stats:
+            subprocess.run([sys.executable, "-c", "pass"])
+        self.assertEqual(stats.returncode, 0)
+        self.assertGreater(stats.cpu_seconds, 0)
+        self.assertEqual(self.recorder.processes, [stats])
+
+    def test_sidecar_and_store(self):
+        run(self.recorder, "import time; time.sleep(0.3)")
+        run(self.recorder, "pass")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = runstats.sidecar_path(Path(tmpdir), "ctadlir", "index")
+            self.recorder.write(path, "index")
+            processes = runstats.read_sidecar(path)
+        self.assertEqual(processes, self.recorder.processes)
+        conn = sqlite3.connect(":memory:")
+        self.assertEqual(runstats.load(conn), dict())
+        runstats.store(conn, "index", processes)
+        runstats.store(conn, "index", processes[:1])
+        runstats.store(conn, "query", processes)
+        stored = runstats.load(conn)
+        self.assertEqual(stored["index"], processes[:1])
+        self.assertEqual(stored["query"], processes)
+        totals = runstats.summarize(processes)
+        self.assertEqual(totals["processes"], 2)
+        self.assertEqual(totals["peak_rss"], max(p.peak_rss for p in processes))
+
+
+if __name__ == "__main__":
+    unittest.main()
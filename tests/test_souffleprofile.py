@@ -0,0 +1,117 @@
+import io
+import sqlite3
+import unittest
+
+from ctadl.vis import souffleprofile
+
+
+def runtime(seconds):
+    return {"start": 1000000, "end": 1000000 + int(seconds * 1e6)}
+
+
+log = {
+    "root": {
+        "program": {
+            "relation": {
+                "Foo": {
+                    "runtime": runtime(2),
+                    "num-tuples": 10,
+                    "non-recursive-rule": {
+                        "Foo(x) :- \n   Bar(x).": {
+                            "runtime": runtime(1.5),
+                            "num-tuples": 10,
+                            "source-locator": "graph/dataflow.dl [2:1-2:20]",
+                        }
+                    },
+                },
+                "Reach": {
+                    "iteration": [
+                        {
+                            "runtime": runtime(1),
+                            "num-tuples": 5,
+                            "recursive-rule": {
+                                "Reach(x) :- Reach(y), E(y, x).": {
+                                    "0": {"runtime": runtime(0.5), "num-tuples": 5}
+                                }
+                            },
+                        },
+                        {
+                            "runtime": runtime(3),
+                            "num-tuples": 7,
+                            "recursive-rule": {
+                                "Reach(x) :- Reach(y), E(y, x).": {
+                                    "0": {"runtime": runtime(2.5), "num-tuples": 7}
+                                }
+                            },
+                        },
+                    ]
+                },
+            }
+        }
+    }
+}
+
+
+class TestSouffleProfile(unittest.TestCase):
+    def test_parse(self):
+        rows = {
+            (r.kind, r.rule or r.relation): r
+            for r in souffleprofile.parse(log, "index")
+        }
+        self.assertAlmostEqual(rows["relation", "Reach"].seconds, 4)
+        self.assertEqual(rows["relation", "Reach"].tuples, 12)
+        rule = rows["rule", "Reach(x) :- Reach(y), E(y, x)."]
+        self.assertAlmostEqual(rule.seconds, 3)
+        self.assertEqual((rule.relation, rule.tuples), ("Reach", 12))
+        rule = rows["rule", "Foo(x) :- Bar(x)."]
+        self.assertEqual(rule.locator, "graph/dataflow.dl [2:1-2:20]")
+
+    def test_parse_sums_versions(self):
+        doc = {
+            "root": {
+                "program": {
+                    "relation": {
+                        "Reach": {
+                            "iteration": [
+                                {
+                                    "recursive-rule": {
+                                        "Reach(x) :- Reach(y), E(y, x).": {
+                                            "0": {
+                                                "runtime": runtime(1),
+                                                "num-tuples": 2,
+                                            },
+                                            "1": {
+                                                "runtime": runtime(3),
+                                                "num-tuples": 7,
+                                            },
+                                        }
+                                    }
+                                }
+                            ]
+                        }
+                    }
+                }
+            }
+        }
+        (rule,) = [r for r in souffleprofile.parse(doc, "index") if r.kind == "rule"]
+        self.assertAlmostEqual(rule.seconds, 4)
+        self.assertEqual(rule.tuples, 9)
+
+    def test_store_and_load(self):
+        conn = sqlite3.connect(":memory:")
+        self.assertEqual(souffleprofile.load(conn), [])
+        souffleprofile.store(conn, "index", souffleprofile.parse(log, "index"))
+        souffleprofile.store(conn, "query", souffleprofile.parse(log, "query"))
+        # Storing a phase again replaces it
+        souffleprofile.store(conn, "index", souffleprofile.parse(log, "index"))
+        rows = souffleprofile.load(conn)
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[0].relation, "Reach")
+        out = io.StringIO()
+        souffleprofile.print_report(rows, out, limit=1)
+        self.assertIn("index profile: 2 rules, 4.50s total", out.getvalue())
+        self.assertNotIn("Foo(x)", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import io
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from ctadl.vis import model, sqlprofile
+
+
+def here() -> str:
+    """Returns the call site of its caller, as the profiler records it"""
+    frame = sys._getframe(1)
+    return f"test_sqlprofile.py:{frame.f_lineno + 1}:{frame.f_code.co_name}"
+
+
+class TestSqlProfile(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE T (x INTEGER, y TEXT)")
+        self.conn.executemany(
+            "INSERT INTO T VALUES (?, ?)", [(i, str(i)) for i in range(10)]
+        )
+        self.profiler = sqlprofile.enable()
+
+    def tearDown(self):
+        sqlprofile.disable()
+        self.conn.close()
+
+    def test_disable(self):
+        self.assertIs(sqlprofile.disable(), self.profiler)
+        self.assertIsNone(model.profiler)
+        self.assertIsNone(sqlprofile.disable())
+        model.execute(self.conn, "SELECT x FROM T").fetchall()
+        self.assertEqual(self.profiler.stats, dict())
+
+    def test_rows_and_calls(self):
+        self.assertEqual(
+            len(model.execute(self.conn, "SELECT x FROM T").fetchall()), 10
+        )
+        cur = model.execute(self.conn, "SELECT  x\n  FROM T")
+        self.assertEqual(cur.fetchone(), (0,))
+        self.assertEqual(len(cur.fetchmany(3)), 3)
+        self.assertEqual(len(list(cur)), 6)
+        self.assertIsNone(cur.fetchone())
+        # Whitespace doesn't make a statement distinct
+        (stats,) = self.profiler.stats.values()
+        self.assertEqual(
+            (stats.sql, stats.calls, stats.rows), ("SELECT x FROM T", 2, 20)
+        )
+        model.executemany(
+            self.conn, "INSERT INTO T VALUES (?, ?)", [(10, "a"), (11, "b")]
+        )
+        stats = self.profiler.stats["INSERT INTO T VALUES (?, ?)"]
+        self.assertEqual((stats.calls, stats.rows), (1, 2))
+
+    def test_time_includes_fetching(self):
+        # Each timed call takes one second
+        with mock.patch.object(
+            sqlprofile.time, "perf_counter", side_effect=itertools.count()
+        ):
+            cur = model.execute(self.conn, "SELECT x FROM T WHERE x < ?", (3,))
+            cur.fetchone()
+            cur.fetchmany(1)
+            cur.fetchall()
+            for _ in model.execute(self.conn, "SELECT x FROM T WHERE x < ?", (3,)):
+                pass
+        stats = self.profiler.stats["SELECT x FROM T WHERE x < ?"]
+        # Two executes, three fetches, and four nexts, the last of which
+        # ends the iteration
+        self.assertEqual(stats.seconds, 9)
+        self.assertEqual(stats.rows, 6)
+
+    def test_cursor_passes_through(self):
+        cur = model.execute(self.conn, "SELECT x, y FROM T")
+        self.assertIsInstance(cur, sqlprofile.ProfiledCursor)
+        self.assertEqual([d[0] for d in cur.description], ["x", "y"])
+
+    def test_call_sites(self):
+        sites = []
+        for _ in range(2):
+            sites.append(here())
+            model.execute(self.conn, "SELECT y FROM T").fetchall()
+        sites.append(here())
+        model.execute(self.conn, "SELECT y FROM T").fetchall()
+        stats = self.profiler.stats["SELECT y FROM T"]
+        self.assertEqual(stats.call_sites, {sites[0]: 2, sites[2]: 1})
+        self.assertEqual(stats.as_dict()["call_sites"], {sites[0]: 2, sites[2]: 1})
+
+    def profile_cheap_and_expensive(self):
+        with mock.patch.object(
+            sqlprofile.time, "perf_counter", side_effect=[0, 1, 1, 1, 0, 5, 5, 5]
+        ):
+            model.execute(self.conn, "SELECT x FROM T").fetchall()
+            model.execute(self.conn, "SELECT y FROM T").fetchall()
+
+    def test_ranked(self):
+        self.profile_cheap_and_expensive()
+        self.assertEqual(
+            [(s.sql, s.seconds) for s in self.profiler.ranked()],
+            [("SELECT y FROM T", 5), ("SELECT x FROM T", 1)],
+        )
+
+    def test_write_json(self):
+        self.profile_cheap_and_expensive()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "sql-profile.json")
+            self.profiler.write_json(path)
+            with open(path) as fp:
+                doc = json.load(fp)
+        self.assertEqual(doc["sql_seconds"], 6)
+        self.assertEqual(
+            [(s["sql"], s["calls"], s["rows"]) for s in doc["statements"]],
+            [("SELECT y FROM T", 1, 10), ("SELECT x FROM T", 1, 10)],
+        )
+        self.assertIsNone(doc["statements"][0]["plan"])
+
+    def test_print_report(self):
+        self.profile_cheap_and_expensive()
+        out = io.StringIO()
+        self.profiler.print_report(out, limit=1)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "sql profile: 2 statements, 6.00s total")
+        self.assertTrue(lines[2].endswith("SELECT y FROM T"))
+        self.assertEqual(lines[2].split()[:3], ["5.000", "1", "10"])
+        self.assertIn("at test_sqlprofile.py:", lines[3])
+        # Only the most expensive statement
+        self.assertEqual(len(lines), 4)
+
+    def test_explain(self):
+        self.conn.execute("CREATE INDEX T_x ON T (x)")
+        model.execute(self.conn, "SELECT y FROM T WHERE x = ?", (1,)).fetchall()
+        self.assertIsNone(self.profiler.stats["SELECT y FROM T WHERE x = ?"].plan)
+        # Explained the first time explain is asked for, and only then
+        model.execute(self.conn, "SELECT y FROM T WHERE x = ?", (1,), explain=True)
+        plan = self.profiler.stats["SELECT y FROM T WHERE x = ?"].plan
+        self.assertTrue(any("T_x" in line for line in plan), plan)
+
+        profiler = sqlprofile.enable(explain=True)
+        cur = model.execute(self.conn, "SELECT x FROM T WHERE y = ?", ("1",))
+        self.assertEqual(cur.fetchall(), [(1,)])
+        (stats,) = profiler.stats.values()
+        self.assertTrue(any("SCAN" in line for line in stats.plan), stats.plan)
+        # The plan doesn't count as a call or its rows
+        self.assertEqual((stats.calls, stats.rows), (1, 1))
+        out = io.StringIO()
+        profiler.print_report(out)
+        self.assertIn("plan: ", out.getvalue())
+
+    def test_explain_failure(self):
+        profiler = sqlprofile.enable(explain=True)
+        with self.assertRaises(sqlite3.OperationalError):
+            model.execute(self.conn, "SELECT z FROM T")
+        self.assertEqual(profiler.stats["SELECT z FROM T"].plan, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
-import json
+# Superseded by 'ctadl models merge', which this now calls into
 import sys
 
+from ctadl.modelmerge import ModelMerger
+
 if len(sys.argv) < 2:
     print(f'Usage {sys.argv[0]} <out_file> <in_file1> <in_file2> ...')
     sys.exit(1)
@@ -10,13 +12,8 @@ if len(in_files) < 2:
     print('You need to merge at least two files')
     sys.exit(1)
 
-mega_json_file = None
+merger = ModelMerger()
 for fname in in_files:
-    with open(fname) as f:
-        jdata = json.load(f)
-        if mega_json_file is None:
-            mega_json_file = jdata
-        else:
-            mega_json_file['model_generators'].extend(jdata['model_generators'])
+    merger.add_file(fname)
 with open(out_file, 'w') as f:
-    json.dump(mega_json_file, f)
+    merger.write(f)